@@ -0,0 +1,61 @@
+import copy
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+
+from foodgram.invalidation import bus
+
+from .caches import LocalTTLCache
+
+local_tokens = LocalTTLCache(
+    settings.TOKEN_CACHE_LOCAL_SIZE, settings.TOKEN_CACHE_LOCAL_TTL
+)
+bus.subscribe('auth', local_tokens.clear)
+
+
+def token_cache_key(key):
+    """
+    Ключ кэша по хэшу токена, чтобы сам токен не лежал в кэше.
+
+    Если кэш Django свой у каждого воркера, в ключ входит версия темы
+    'auth': выход или деактивация в другом воркере делают записи этого
+    воркера недостижимыми.
+    """
+    cache_key = 'auth-token:' + hashlib.sha256(key.encode()).hexdigest()
+    if not bus.store.shared_cache:
+        cache_key = f'{cache_key}:{bus.version("auth")}'
+    return cache_key
+
+
+def invalidate_token(key):
+    cache_key = token_cache_key(key)
+    local_tokens.delete(cache_key)
+    cache.delete(cache_key)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication, который не ходит в БД на каждый запрос.
+
+    Пара (пользователь, токен) ищется сначала в LRU-кэше процесса
+    (TOKEN_CACHE_LOCAL_TTL секунд), затем в общем кэше Django
+    (TOKEN_CACHE_TTL секунд) и только потом в БД. Записи удаляются
+    сигналами при удалении токена (выход через djoser) и при любом
+    сохранении пользователя: смене пароля, деактивации. Кэши других
+    воркеров сбрасываются через тему 'auth' шины инвалидации.
+    """
+
+    def authenticate_credentials(self, key):
+        cache_key = token_cache_key(key)
+        credentials = local_tokens.get(cache_key)
+        if credentials is None:
+            credentials = cache.get(cache_key)
+            if credentials is None:
+                credentials = super().authenticate_credentials(key)
+                cache.set(cache_key, credentials, settings.TOKEN_CACHE_TTL)
+            local_tokens.set(cache_key, credentials)
+        user, token = credentials
+        # Копия, чтобы изменения request.user не попали в общий кэш.
+        return copy.copy(user), token
@@ -0,0 +1,103 @@
+import base64
+import io
+import json
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.handlers.exception import response_for_exception
+from django.core.handlers.wsgi import WSGIRequest
+from django.urls import Resolver404, resolve
+
+# Заголовки основного запроса, которые не относятся к подзапросам.
+SKIPPED_META = {
+    'CONTENT_TYPE', 'CONTENT_LENGTH', 'HTTP_ACCEPT_ENCODING',
+    'HTTP_IF_NONE_MATCH', 'HTTP_IF_MODIFIED_SINCE', 'wsgi.input',
+}
+# Заголовки ответа подзапроса, которые попадают в ответ пакета.
+RESPONSE_HEADERS = ('Content-Type', 'ETag', 'Location')
+
+
+def build_subrequest(request, method, path, body=None):
+    """
+    WSGI-запрос для подзапроса пакета.
+
+    Копирует окружение основного запроса и его аутентификацию:
+    DRF примет пользователя и токен как уже проверенные.
+    """
+    url = urlsplit(path)
+    content = b'' if body is None else json.dumps(body).encode()
+    environ = {
+        key: value for key, value in request.META.items()
+        if key not in SKIPPED_META
+    }
+    environ.update({
+        'REQUEST_METHOD': method,
+        'SCRIPT_NAME': '',
+        'PATH_INFO': url.path,
+        'QUERY_STRING': url.query,
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(content)),
+        'wsgi.input': io.BytesIO(content),
+    })
+    subrequest = WSGIRequest(environ)
+    subrequest._force_auth_user = request.user
+    subrequest._force_auth_token = request.auth
+    return subrequest
+
+
+def response_to_dict(response):
+    """Статус, заголовки и тело ответа: JSON, текст или base64."""
+    if response.streaming:
+        content = b''.join(response.streaming_content)
+    else:
+        content = response.content
+    content_type = response.get('Content-Type', '')
+    if not content:
+        body = None
+    elif content_type.startswith('application/json'):
+        body = json.loads(content)
+    elif content_type.startswith('text/'):
+        body = content.decode(response.charset)
+    else:
+        body = base64.b64encode(content).decode()
+    return {
+        'status': response.status_code,
+        'headers': {
+            name: response[name] for name in RESPONSE_HEADERS
+            if response.has_header(name)
+        },
+        'body': body,
+    }
+
+
+def run_subrequest(request, method, path, body=None):
+    """
+    Выполняет подзапрос к эндпоинтам API в этом же процессе.
+
+    Доступны только viewset'ы из BATCH_ALLOWED_ROUTES: метрики, вход
+    и сам пакет закрыты. Подзапрос вызывает view напрямую, минуя
+    middleware: у него нет своих Server-Timing, профилирования и
+    проверки N+1, а версии шины инвалидации сверены основным запросом.
+    """
+    try:
+        match = resolve(urlsplit(path).path)
+    except Resolver404:
+        match = None
+    if match is None or 'api' not in match.namespaces:
+        return {'status': 404, 'headers': {}, 'body': None}
+    route = (match.url_name or '').partition('-')[0]
+    if route not in settings.BATCH_ALLOWED_ROUTES:
+        return {
+            'status': 400,
+            'headers': {},
+            'body': {'errors': 'Этот эндпоинт недоступен в пакете'},
+        }
+    subrequest = build_subrequest(request, method, path, body)
+    subrequest.resolver_match = match
+    try:
+        response = match.func(subrequest, *match.args, **match.kwargs)
+        if hasattr(response, 'render') and callable(response.render):
+            response = response.render()
+    except Exception as exc:
+        response = response_for_exception(subrequest, exc)
+    return response_to_dict(response)
@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.urls import reverse
+
+from foodgram.invalidation import bus
+
+from .projections import USER_COLUMNS, user_dict
+from .serializers import TagSerializer
+from .viewer_ids import load_ids
+from recipes.models import Tag
+
+
+def get_tags():
+    """Все теги в виде TagSerializer, из кэша до смены версии тегов."""
+    key = f'bootstrap-tags:{bus.version("tags")}'
+    tags = cache.get(key)
+    if tags is None:
+        tags = [
+            dict(tag) for tag in
+            TagSerializer(Tag.objects.all(), many=True).data
+        ]
+        cache.set(key, tags, settings.BOOTSTRAP_CACHE_TTL)
+    return tags
+
+
+def get_current_user(user):
+    """Текущий пользователь в виде CustomUserSerializer без запросов."""
+    if user.is_anonymous:
+        return None
+    # На себя подписаться нельзя, поэтому is_subscribed всегда False.
+    return user_dict(
+        {name: getattr(user, name) for name in USER_COLUMNS}, False
+    )
+
+
+def get_viewer_counts(user):
+    """Сколько рецептов у пользователя в избранном и в списке покупок."""
+    if user.is_anonymous:
+        return {'favorites_count': 0, 'shopping_cart_count': 0}
+    return {
+        'favorites_count': len(load_ids('favorites', user.pk)),
+        'shopping_cart_count': len(load_ids('shopping_cart', user.pk)),
+    }
+
+
+def get_ingredients_stamp(catalog, request):
+    """Версия каталога ингредиентов: клиент обновляет его по смене etag."""
+    return {
+        'etag': catalog.etag,
+        'count': catalog.count,
+        'url': request.build_absolute_uri(reverse('api:ingredients-list')),
+    }
@@ -0,0 +1,45 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LocalTTLCache:
+    """
+    LRU-кэш в памяти процесса с ограничением по времени жизни записей.
+
+    Потокобезопасен. Подходит для коротко живущих данных, устаревание
+    которых в других воркерах ограничено ttl.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            item = self.data.get(key)
+            if item is None:
+                return default
+            expires, value = item
+            if expires < time.monotonic():
+                del self.data[key]
+                return default
+            self.data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = (time.monotonic() + self.ttl, value)
+            self.data.move_to_end(key)
+            while len(self.data) > self.max_size:
+                self.data.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
@@ -0,0 +1,57 @@
+import gzip
+import hashlib
+import io
+import threading
+
+from .renderers import FastJSONRenderer
+from .serializers import IngredientSerializer
+from recipes.catalog import catalog_version
+from recipes.models import Ingredient
+
+
+def compress(content):
+    """gzip с нулевым mtime: у всех воркеров одни байты под одним ETag."""
+    buffer = io.BytesIO()
+    with gzip.GzipFile(
+        fileobj=buffer, mode='wb', compresslevel=9, mtime=0
+    ) as file:
+        file.write(content)
+    return buffer.getvalue()
+
+
+class IngredientCatalog:
+    """
+    Полный список ингредиентов, готовый к отдаче.
+
+    Хранит в памяти процесса ответ IngredientViewSet без фильтров:
+    отрендеренный JSON, его gzip-версию и ETag по содержимому.
+    Пересобирается, только когда меняется catalog_version().
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+
+    def build(self, version):
+        data = IngredientSerializer(Ingredient.objects.all(), many=True).data
+        content = FastJSONRenderer().render(data)
+        digest = hashlib.sha256(content).hexdigest()[:32]
+        self.content = content
+        self.count = len(data)
+        self.gzipped = compress(content)
+        self.etag = f'"{digest}"'
+        self.gzip_etag = f'"{digest}-gzip"'
+        self.version = version
+
+    def get(self):
+        # Версию читаем до выборки: изменение во время сборки
+        # поменяет версию, и следующий запрос соберёт каталог заново.
+        version = catalog_version()
+        if self.version != version:
+            with self.lock:
+                if self.version != version:
+                    self.build(version)
+        return self
+
+
+ingredient_catalog = IngredientCatalog()
@@ -0,0 +1,126 @@
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.permissions import SAFE_METHODS
+
+from foodgram.invalidation import bus
+
+_state = threading.local()
+# Заголовок запросов nginx, обновляющих микрокэш после записи: реплика
+# могла ещё не получить запись, и в кэш попала бы старая страница.
+# Снаружи nginx его вырезает.
+READ_PRIMARY_HEADER = 'HTTP_X_READ_PRIMARY'
+
+
+def pin_key(user):
+    return f'db-pin:{user.pk}'
+
+
+def pin_path(user):
+    return os.path.join(settings.REPLICA_PIN_DIR, str(user.pk))
+
+
+def pin_to_primary(user):
+    """
+    После записи пользователь какое-то время читает только с primary.
+
+    Отметка должна быть видна всем воркерам: она хранится в общем кэше
+    Django, а если кэш свой у каждого процесса — во времени изменения
+    файла пользователя в REPLICA_PIN_DIR.
+    """
+    if bus.store.shared_cache:
+        cache.set(pin_key(user), True, settings.REPLICA_PIN_SECONDS)
+        return
+    os.makedirs(settings.REPLICA_PIN_DIR, exist_ok=True)
+    path = pin_path(user)
+    with open(path, 'a'):
+        os.utime(path)
+
+
+def is_pinned(user):
+    if not user.is_authenticated:
+        return False
+    if bus.store.shared_cache:
+        return bool(cache.get(pin_key(user)))
+    path = pin_path(user)
+    try:
+        pinned_at = os.stat(path).st_mtime
+    except FileNotFoundError:
+        return False
+    if time.time() - pinned_at < settings.REPLICA_PIN_SECONDS:
+        return True
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+    return False
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """Разрешает чтение с реплик внутри блока with."""
+    previous = getattr(_state, 'use_replica', False)
+    _state.use_replica = enabled
+    try:
+        yield
+    finally:
+        _state.use_replica = previous
+
+
+class ReplicaRouter:
+    """
+    Роутер БД: чтение с реплик там, где это разрешено.
+
+    Реплики (DATABASE_REPLICAS) используются только для чтения
+    в безопасных запросах вьюсетов с ReplicaReadMixin. Всё остальное,
+    включая любую запись, идёт в default.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if replicas and getattr(_state, 'use_replica', False):
+            return random.choice(replicas)
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+class ReplicaReadMixin:
+    """
+    Безопасные запросы вьюсета читают с реплики.
+
+    Пользователь, который только что что-то изменил (избранное,
+    корзина, рецепт), REPLICA_PIN_SECONDS секунд читает с primary,
+    чтобы не увидеть состояние до своей же записи. С primary читают
+    и запросы обновления микрокэша nginx (READ_PRIMARY_HEADER).
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        _state.use_replica = (
+            request.method in SAFE_METHODS
+            and not request.META.get(READ_PRIMARY_HEADER)
+            and not is_pinned(request.user)
+        )
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        _state.use_replica = False
+        if (
+            request.method not in SAFE_METHODS
+            and response.status_code < 400
+            and request.user.is_authenticated
+        ):
+            pin_to_primary(request.user)
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -1,9 +1,30 @@
-import base64
+import binascii
+import io
+import json
 
 import webcolors
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.files.uploadedfile import (
+    InMemoryUploadedFile,
+    TemporaryUploadedFile
+)
+from PIL import Image
 from rest_framework.serializers import Field, ImageField, ValidationError
 
+from recipes.images import variant_urls
+
+# Кратно 4, чтобы каждый кусок base64 декодировался независимо.
+BASE64_CHUNK_SIZE = 64 * 1024
+# Сколько байт заголовка нужно Pillow, чтобы определить размеры картинки.
+IMAGE_HEADER_SIZE = 64 * 1024
+IMAGE_SIGNATURES = {
+    b'\xff\xd8\xff': 'jpeg',
+    b'\x89PNG\r\n\x1a\n': 'png',
+    b'GIF87a': 'gif',
+    b'GIF89a': 'gif',
+    b'BM': 'bmp',
+}
+
 
 class Hex2NameColor(Field):
     def to_representation(self, value):
@@ -16,10 +37,185 @@ class Hex2NameColor(Field):
             raise ValidationError('Для этого цвета нет имени')
 
 
+def absolute_variant_urls(name, ready, storage, request=None):
+    """Ссылки на копии картинки, абсолютные при наличии запроса."""
+    if not name:
+        return None
+    urls = variant_urls(name, ready, storage)
+    if request is None:
+        return urls
+    return {
+        size: {
+            image_format: request.build_absolute_uri(url)
+            for image_format, url in formats.items()
+        }
+        for size, formats in urls.items()
+    }
+
+
+class ImageVariantsField(Field):
+    """Словарь ссылок на уменьшенные копии картинки по размерам."""
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        ready = getattr(value.instance, 'image_variants', '') == value.name
+        return absolute_variant_urls(
+            value.name, ready, value.storage, self.context.get('request')
+        )
+
+
+class JSONTextField(Field):
+    """JSON, хранящийся в текстовом поле модели, в разобранном виде."""
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return json.loads(value)
+
+
+def guess_image_format(header):
+    """Определяет формат картинки по сигнатуре первых байт."""
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'webp'
+    for signature, image_format in IMAGE_SIGNATURES.items():
+        if header.startswith(signature):
+            return image_format
+    return None
+
+
 class Base64ImageField(ImageField):
+    """
+    Поле для картинок, переданных строкой data:image/...;base64,....
+
+    Обычные загруженные файлы (multipart) принимаются как есть,
+    с теми же ограничениями размера и разрешения.
+
+    Строка декодируется кусками: пока результат меньше
+    FILE_UPLOAD_MAX_MEMORY_SIZE, он хранится в памяти, дальше
+    переносится во временный файл, как это делают загрузчики Django.
+    Размер файла и разрешение картинки проверяются по заголовку,
+    до декодирования всей строки.
+    """
+
+    default_error_messages = {
+        'invalid_base64': 'Некорректная строка base64.',
+        'invalid_header': 'Файл не является поддерживаемой картинкой.',
+        'max_size': 'Размер картинки превышает {max_size} байт.',
+        'max_dimension': (
+            'Разрешение картинки превышает {max_dimension}'
+            'x{max_dimension} пикселей.'
+        ),
+    }
+
+    def __init__(self, *args, **kwargs):
+        self.max_size = kwargs.pop(
+            'max_size', settings.BASE64_IMAGE_MAX_SIZE
+        )
+        self.max_dimension = kwargs.pop(
+            'max_dimension', settings.BASE64_IMAGE_MAX_DIMENSION
+        )
+        super().__init__(*args, **kwargs)
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            data = self.decode(data)
+        elif hasattr(data, 'size'):
+            self.check_file(data)
         return super().to_internal_value(data)
+
+    def check_file(self, file):
+        """Проверяет загруженный файл теми же ограничениями."""
+        if file.size > self.max_size:
+            self.fail('max_size', max_size=self.max_size)
+        self.check_dimensions(file)
+
+    def decode(self, data):
+        """Потоково декодирует data-URI во временный файл."""
+        separator = data.find(';base64,')
+        if separator == -1:
+            self.fail('invalid_base64')
+        content_type = data[len('data:'):separator]
+        start = separator + len(';base64,')
+        # Размер проверяется по мере декодирования: оценка по длине
+        # строки учла бы переводы строк MIME.
+        file = io.BytesIO()
+        header = b''
+        size = 0
+        for decoded in self.decode_chunks(data, start):
+            size += len(decoded)
+            if size > self.max_size:
+                self.fail('max_size', max_size=self.max_size)
+            if len(header) < IMAGE_HEADER_SIZE:
+                header += decoded[:IMAGE_HEADER_SIZE - len(header)]
+                if len(header) >= IMAGE_HEADER_SIZE:
+                    self.check_header(header)
+            if (
+                isinstance(file, io.BytesIO)
+                and size > settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+            ):
+                file = self.move_to_disk(file, content_type)
+            file.write(decoded)
+        if len(header) < IMAGE_HEADER_SIZE:
+            self.check_header(header)
+        self.check_dimensions(file)
+
+        image_format = guess_image_format(header)
+        name = f'temp.{image_format}'
+        if isinstance(file, io.BytesIO):
+            return InMemoryUploadedFile(
+                file, None, name, content_type, size, None
+            )
+        file.name = name
+        file.size = size
+        return file
+
+    def decode_chunks(self, data, start):
+        """Отдаёт декодированные байты кусками по BASE64_CHUNK_SIZE."""
+        tail = ''
+        for position in range(start, len(data), BASE64_CHUNK_SIZE):
+            chunk = tail + ''.join(
+                data[position:position + BASE64_CHUNK_SIZE].split()
+            )
+            aligned = len(chunk) - len(chunk) % 4
+            chunk, tail = chunk[:aligned], chunk[aligned:]
+            try:
+                yield binascii.a2b_base64(chunk)
+            except binascii.Error:
+                self.fail('invalid_base64')
+        if tail:
+            self.fail('invalid_base64')
+
+    @staticmethod
+    def move_to_disk(buffer, content_type):
+        """Переносит уже декодированные байты во временный файл."""
+        file = TemporaryUploadedFile('temp', content_type, 0, None)
+        file.write(buffer.getvalue())
+        buffer.close()
+        return file
+
+    def check_header(self, header):
+        """Проверяет сигнатуру и, если хватает байт, разрешение."""
+        if guess_image_format(header) is None:
+            self.fail('invalid_header')
+        self.check_dimensions(io.BytesIO(header), strict=False)
+
+    def check_dimensions(self, file, strict=True):
+        """Читает из заголовка ширину и высоту, не декодируя пиксели."""
+        file.seek(0)
+        try:
+            width, height = Image.open(file).size
+        except Exception:
+            if strict:
+                self.fail('invalid_header')
+            return
+        finally:
+            file.seek(0)
+        if max(width, height) > self.max_dimension:
+            self.fail('max_dimension', max_dimension=self.max_dimension)
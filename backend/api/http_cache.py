@@ -0,0 +1,63 @@
+import logging
+import threading
+import urllib.request
+
+from django.conf import settings
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from rest_framework.permissions import SAFE_METHODS
+
+logger = logging.getLogger(__name__)
+
+
+class PublicCacheMixin:
+    """
+    Разрешает общим кэшам хранить ответы анонимным пользователям.
+
+    Успешный безопасный ответ без авторизации помечается как public
+    на PUBLIC_CACHE_MAX_AGE секунд, ответ пользователю с токеном — как
+    private. Vary: Authorization не даёт кэшу отдать одно другому.
+    """
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        if request.method in SAFE_METHODS and response.status_code in (
+            200, 304
+        ):
+            if request.auth is None and request.user.is_anonymous:
+                patch_cache_control(
+                    response, public=True,
+                    max_age=settings.PUBLIC_CACHE_MAX_AGE
+                )
+            else:
+                patch_cache_control(response, private=True)
+            patch_vary_headers(response, ('Authorization',))
+        return response
+
+
+def send_purge(paths):
+    for path in paths:
+        url = f'{settings.NGINX_PURGE_URL}{path}'
+        # Ключ кэша включает Host: обновляем запись каждого домена.
+        for host in settings.NGINX_PURGE_HOSTS:
+            request = urllib.request.Request(url, headers={'Host': host})
+            try:
+                urllib.request.urlopen(request, timeout=2).close()
+            except OSError as error:
+                logger.warning(
+                    'Не удалось обновить кэш nginx %s для %s: %s',
+                    url, host, error
+                )
+
+
+def purge(*paths):
+    """
+    Обновляет записи микрокэша nginx для paths в фоновом потоке.
+
+    Запрос на NGINX_PURGE_URL + path заставляет nginx заново получить
+    ответ у backend и перезаписать кэш. Без NGINX_PURGE_URL ничего
+    не делает; страницы с параметрами устаревают по max-age.
+    """
+    if settings.NGINX_PURGE_URL:
+        threading.Thread(target=send_purge, args=(paths,), daemon=True).start()
@@ -0,0 +1,103 @@
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.db import connections
+from rest_framework.serializers import ListSerializer, Serializer
+
+_local = threading.local()
+_hooks_lock = threading.Lock()
+_hooks_installed = False
+
+
+class RequestStats:
+    """
+    Счётчики времени одного запроса.
+
+    Экземпляр подключается к соединениям с БД как execute_wrapper
+    и считает число запросов и время, проведённое в БД. Новые
+    соединения и время их установки отмечает бэкенд foodgram.db.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.connections = 0
+        self.connect_time = 0.0
+        self.serialization_time = 0.0
+        self.serialization_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - started
+
+
+def current_stats():
+    """Счётчики запроса, который сейчас обрабатывается в этом потоке."""
+    return getattr(_local, 'stats', None)
+
+
+@contextmanager
+def collect_stats():
+    """Собирает статистику по БД и сериализации внутри блока with."""
+    install_serializer_hooks()
+    stats = RequestStats()
+    previous = current_stats()
+    _local.stats = stats
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(stats))
+            yield stats
+    finally:
+        _local.stats = previous
+        if previous is not None:
+            # Запросы к БД внешние счётчики видят сами, а подключения
+            # и сериализацию видит только текущий — передаём их наверх.
+            previous.connections += stats.connections
+            previous.connect_time += stats.connect_time
+            previous.serialization_time += stats.serialization_time
+
+
+def _timed_data(data_property):
+    getter = data_property.fget
+
+    def data(self):
+        stats = current_stats()
+        if stats is None:
+            return getter(self)
+        stats.serialization_depth += 1
+        started = time.perf_counter()
+        db_time = stats.db_time
+        try:
+            return getter(self)
+        finally:
+            stats.serialization_depth -= 1
+            if not stats.serialization_depth:
+                # Запросы из SerializerMethodField считаются временем БД.
+                stats.serialization_time += (
+                    time.perf_counter() - started
+                    - (stats.db_time - db_time)
+                )
+
+    return property(data)
+
+
+def install_serializer_hooks():
+    """
+    Оборачивает Serializer.data и ListSerializer.data таймером.
+
+    Без активного collect_stats обёртка сразу вызывает исходное
+    свойство, поэтому хуки ставятся один раз на процесс.
+    """
+    global _hooks_installed
+    with _hooks_lock:
+        if _hooks_installed:
+            return
+        for serializer_class in (Serializer, ListSerializer):
+            serializer_class.data = _timed_data(serializer_class.data)
+        _hooks_installed = True
@@ -0,0 +1,237 @@
+import json
+import os
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.db.models import Count
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from api.instrumentation import collect_stats
+from recipes.models import Favorite, Ingredient, Recipe
+from users.models import User
+
+BENCHMARKS_DIR = os.path.join(settings.BASE_DIR, 'benchmarks')
+
+
+def percentile(values, percent):
+    """Перцентиль по методу ближайшего ранга."""
+    ordered = sorted(values)
+    index = max(0, round(percent / 100 * len(ordered)) - 1)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+class Command(BaseCommand):
+    """
+    Замеряет скорость основных эндпоинтов API на текущей базе.
+
+    Запросы идут через тестовый клиент в этом же процессе от имени
+    пользователя с наибольшим числом подписок. Для каждого сценария
+    считаются число SQL-запросов, время в БД, время сериализации
+    и перцентили времени ответа. Отчёт пишется в JSON и сравнивается
+    с сохранённым базовым отчётом; без него команда работает только
+    с --update-baseline. Базовый отчёт в репозитории снят на наборе
+    generate_data из README, размер набора записан в отчёте.
+
+    С --close-connections перед запросом и после него соединения
+    с БД закрываются по правилам CONN_MAX_AGE, как это делает
+    WSGI-обработчик; так видна цена установки соединения.
+    """
+
+    help = 'Замеряет скорость эндпоинтов API и сравнивает с базовым отчётом'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument(
+            '--output',
+            default=os.path.join(BENCHMARKS_DIR, 'report.json'),
+            help='Куда записать отчёт',
+        )
+        parser.add_argument(
+            '--baseline',
+            default=os.path.join(BENCHMARKS_DIR, 'baseline.json'),
+            help='Базовый отчёт для сравнения',
+        )
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=0.2,
+            help='Допустимый рост p95 к базовому отчёту (0.2 = 20%%)',
+        )
+        parser.add_argument(
+            '--update-baseline',
+            action='store_true',
+            help='Сохранить отчёт как новый базовый',
+        )
+        parser.add_argument(
+            '--scenario',
+            action='append',
+            help='Запустить только указанные сценарии',
+        )
+        parser.add_argument(
+            '--close-connections',
+            action='store_true',
+            help='Закрывать устаревшие соединения с БД вокруг запроса',
+        )
+
+    def get_scenarios(self):
+        """Сценарий: имя -> (url, параметры запроса)."""
+        ingredient = Ingredient.objects.order_by('id').first()
+        search = ingredient.name[:3] if ingredient else 'а'
+        return {
+            'tags_list': (reverse('api:tags-list'), {}),
+            'recipes_list': (reverse('api:recipes-list'), {}),
+            'subscriptions': (
+                reverse('api:users-subscriptions'), {'recipes_limit': 3}
+            ),
+            'ingredients_search': (
+                reverse('api:ingredients-list'), {'name': search}
+            ),
+            'download_shopping_cart': (
+                reverse('api:recipes-download-shopping-cart'), {}
+            ),
+        }
+
+    def get_client(self):
+        viewer = (
+            User.objects.annotate(follows=Count('follower'))
+            .order_by('-follows', 'id').first()
+        )
+        if viewer is None:
+            raise CommandError(
+                'В базе нет пользователей, сначала выполните generate_data.'
+            )
+        client = APIClient(SERVER_NAME='localhost')
+        client.force_authenticate(user=viewer)
+        return client
+
+    @staticmethod
+    def get_dataset():
+        return {
+            'users': User.objects.count(),
+            'recipes': Recipe.objects.count(),
+            'favorites': Favorite.objects.count(),
+        }
+
+    def measure(self, client, url, params):
+        started = time.perf_counter()
+        if self.close_connections:
+            close_old_connections()
+        with collect_stats() as stats:
+            response = client.get(url, params)
+            b''.join(response)
+        if self.close_connections:
+            close_old_connections()
+        latency = time.perf_counter() - started
+        if response.status_code >= 400:
+            raise CommandError(f'{url}: ответ {response.status_code}')
+        return latency, stats
+
+    def run_scenario(self, client, url, params, iterations, warmup):
+        for _ in range(warmup):
+            self.measure(client, url, params)
+        latencies, samples = [], []
+        for _ in range(iterations):
+            latency, stats = self.measure(client, url, params)
+            latencies.append(latency * 1000)
+            samples.append(stats)
+        return {
+            'queries': max(stats.queries for stats in samples),
+            'db_ms': statistics.median(
+                stats.db_time * 1000 for stats in samples
+            ),
+            'connect_ms': statistics.mean(
+                stats.connect_time * 1000 for stats in samples
+            ),
+            'serialization_ms': statistics.median(
+                stats.serialization_time * 1000 for stats in samples
+            ),
+            'p50_ms': percentile(latencies, 50),
+            'p95_ms': percentile(latencies, 95),
+            'p99_ms': percentile(latencies, 99),
+        }
+
+    def compare(self, report, baseline, threshold):
+        """Список регрессий относительно базового отчёта."""
+        regressions = []
+        for name, result in report['scenarios'].items():
+            base = baseline.get('scenarios', {}).get(name)
+            if base is None:
+                continue
+            if result['queries'] > base['queries']:
+                regressions.append(
+                    f'{name}: SQL-запросов {base["queries"]} '
+                    f'-> {result["queries"]}'
+                )
+            if result['p95_ms'] > base['p95_ms'] * (1 + threshold):
+                regressions.append(
+                    f'{name}: p95 {base["p95_ms"]:.1f} мс '
+                    f'-> {result["p95_ms"]:.1f} мс'
+                )
+        return regressions
+
+    @staticmethod
+    def write(path, data):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(data, file, indent=2, ensure_ascii=False)
+
+    def handle(self, *args, **options):
+        if not (
+            options['update_baseline'] or os.path.exists(options['baseline'])
+        ):
+            raise CommandError(
+                f'Базовый отчёт {options["baseline"]} не найден, '
+                'сохраните его с --update-baseline.'
+            )
+        self.close_connections = options['close_connections']
+        client = self.get_client()
+        scenarios = self.get_scenarios()
+        selected = options['scenario'] or list(scenarios)
+        unknown = set(selected) - set(scenarios)
+        if unknown:
+            raise CommandError(f'Неизвестные сценарии: {", ".join(unknown)}')
+
+        report = {
+            'iterations': options['iterations'],
+            'dataset': self.get_dataset(),
+            'scenarios': {},
+        }
+        for name in selected:
+            url, params = scenarios[name]
+            result = self.run_scenario(
+                client, url, params,
+                options['iterations'], options['warmup']
+            )
+            report['scenarios'][name] = result
+            self.stdout.write(
+                f'{name}: {result["queries"]} SQL, '
+                f'БД {result["db_ms"]:.1f} мс, '
+                f'соединение {result["connect_ms"]:.2f} мс, '
+                f'сериализация {result["serialization_ms"]:.1f} мс, '
+                f'p50/p95/p99 {result["p50_ms"]:.1f}/'
+                f'{result["p95_ms"]:.1f}/{result["p99_ms"]:.1f} мс'
+            )
+        self.write(options['output'], report)
+
+        if options['update_baseline']:
+            self.write(options['baseline'], report)
+            return
+        with open(options['baseline'], encoding='utf-8') as file:
+            baseline = json.load(file)
+        if baseline.get('dataset') != report['dataset']:
+            self.stdout.write(
+                f'Базовый отчёт снят на другом наборе данных '
+                f'{baseline.get("dataset")}, время сравнимо лишь примерно.'
+            )
+        regressions = self.compare(report, baseline, options['threshold'])
+        if regressions:
+            raise CommandError(
+                'Замедление относительно базового отчёта:\n'
+                + '\n'.join(regressions)
+            )
+        self.stdout.write('Регрессий нет.')
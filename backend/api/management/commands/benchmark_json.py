@@ -0,0 +1,84 @@
+import io
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from api.parsers import FastJSONParser
+from api.renderers import FastJSONRenderer, orjson
+
+
+class Command(BaseCommand):
+    """
+    Сравнивает стандартные JSONRenderer и JSONParser с FastJSONRenderer
+    и FastJSONParser на странице списка рецептов.
+    """
+
+    help = 'Сравнивает скорость рендеринга и разбора JSON на списке рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument(
+            '--page-size', type=int, default=100,
+            help='Сколько рецептов на странице',
+        )
+
+    def get_page(self, page_size):
+        client = APIClient(SERVER_NAME='localhost')
+        response = client.get(
+            reverse('api:recipes-list'), {'limit': page_size}
+        )
+        if response.status_code != 200:
+            raise CommandError(f'Список рецептов: {response.status_code}')
+        return response.data
+
+    @staticmethod
+    def timeit(function, iterations):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            function()
+        return (time.perf_counter() - started) / iterations * 1000
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            self.stdout.write('orjson не установлен, сравнивать не с чем.')
+            return
+        data = self.get_page(options['page_size'])
+        iterations = options['iterations']
+        content = JSONRenderer().render(data)
+        fast_content = FastJSONRenderer().render(data)
+        if fast_content != content:
+            raise CommandError(
+                'Ответы FastJSONRenderer и JSONRenderer различаются.'
+            )
+
+        results = {
+            'render': (
+                self.timeit(lambda: JSONRenderer().render(data), iterations),
+                self.timeit(
+                    lambda: FastJSONRenderer().render(data), iterations
+                ),
+            ),
+            'parse': (
+                self.timeit(
+                    lambda: JSONParser().parse(io.BytesIO(content)),
+                    iterations,
+                ),
+                self.timeit(
+                    lambda: FastJSONParser().parse(io.BytesIO(content)),
+                    iterations,
+                ),
+            ),
+        }
+        self.stdout.write(
+            f'Рецептов: {len(data["results"])}, '
+            f'размер ответа {len(content)} байт'
+        )
+        for name, (standard, fast) in results.items():
+            self.stdout.write(
+                f'{name}: json {standard:.3f} мс, orjson {fast:.3f} мс, '
+                f'в {standard / fast:.1f} раза быстрее'
+            )
@@ -0,0 +1,82 @@
+import io
+import os
+import pstats
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    """Сводка по профилям, собранным ProfilingMiddleware."""
+
+    help = 'Объединяет профили запросов и выводит самые затратные функции'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--route',
+            action='append',
+            help='Только указанные маршруты (имя каталога в PROFILING_DIR)',
+        )
+        parser.add_argument(
+            '--filter',
+            default=r'api[/\\](views|serializers)',
+            help='Регулярное выражение для отбора функций в сводке',
+        )
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument(
+            '--collapsed-output',
+            help='Файл, куда записать объединённые свёрнутые стеки',
+        )
+
+    def get_routes(self, selected):
+        if not os.path.isdir(settings.PROFILING_DIR):
+            raise CommandError(f'Каталог {settings.PROFILING_DIR} не найден.')
+        routes = sorted(os.listdir(settings.PROFILING_DIR))
+        return [route for route in routes if not selected or route in selected]
+
+    @staticmethod
+    def read_collapsed(path, collapsed):
+        """Добавляет свёрнутые стеки из файла к общему счётчику."""
+        with open(path) as file:
+            for line in file:
+                stack, _, count = line.rstrip().rpartition(' ')
+                collapsed[stack] += int(count)
+
+    def print_pstats(self, route, dumps, options):
+        output = io.StringIO()
+        stats = pstats.Stats(*dumps, stream=output)
+        stats.sort_stats('cumulative').print_stats(
+            options['filter'], options['limit']
+        )
+        self.stdout.write(f'=== {route}: профилей {len(dumps)} ===')
+        self.stdout.write(output.getvalue())
+
+    def print_collapsed(self, collapsed, limit):
+        leaves = Counter()
+        for stack, count in collapsed.items():
+            leaves[stack.rpartition(';')[2]] += count
+        self.stdout.write('=== Чаще всего на вершине стека ===')
+        for leaf, count in leaves.most_common(limit):
+            self.stdout.write(f'{count:6} {leaf}')
+
+    def handle(self, *args, **options):
+        collapsed = Counter()
+        for route in self.get_routes(options['route']):
+            path = os.path.join(settings.PROFILING_DIR, route)
+            files = [
+                os.path.join(path, name) for name in sorted(os.listdir(path))
+            ]
+            for name in files:
+                if name.endswith('.collapsed'):
+                    self.read_collapsed(name, collapsed)
+            dumps = [name for name in files if name.endswith('.pstats')]
+            if dumps:
+                self.print_pstats(route, dumps, options)
+
+        if collapsed:
+            self.print_collapsed(collapsed, options['limit'])
+        if options['collapsed_output']:
+            with open(options['collapsed_output'], 'w') as file:
+                for stack, count in collapsed.items():
+                    file.write(f'{stack} {count}\n')
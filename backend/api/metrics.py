@@ -0,0 +1,192 @@
+import hmac
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+from django.conf import settings
+
+# Границы корзин гистограмм в секундах.
+BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+HISTOGRAMS = {
+    'total': 'Полное время обработки запроса',
+    'view': 'Время работы view, включая БД и сериализацию',
+    'db': 'Время SQL-запросов',
+    'connect': 'Время установки соединений с БД',
+    'serialization': 'Время сериализации без SQL-запросов',
+    'render': 'Время рендеринга ответа',
+}
+PREFIX = 'foodgram_request'
+
+
+def new_histogram():
+    return {'buckets': [0] * len(BUCKETS), 'sum': 0.0, 'count': 0}
+
+
+class MetricsRegistry:
+    """
+    Гистограммы времени запросов по маршрутам для одного процесса.
+
+    Каждый воркер gunicorn периодически сбрасывает свои гистограммы
+    в отдельный файл METRICS_DIR/metrics-<pid>-<id запуска>.json, а
+    эндпоинт метрик складывает файлы всех воркеров. Так счётчики
+    одного процесса не перетирают другие и внешний сервис не нужен.
+    Файлы умерших воркеров удаляются при сборе; id запуска не даёт
+    новому процессу с тем же pid продолжить чужой файл.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = defaultdict(new_histogram)
+        self.queries = defaultdict(int)
+        self.flushed = 0.0
+        self.pid = self.run_id = None
+
+    def observe(self, route, method, timings, queries):
+        with self.lock:
+            for name, value in timings.items():
+                histogram = self.histograms[(name, route, method)]
+                for index, bound in enumerate(BUCKETS):
+                    if value <= bound:
+                        histogram['buckets'][index] += 1
+                histogram['sum'] += value
+                histogram['count'] += 1
+            self.queries[(route, method)] += queries
+        if time.monotonic() - self.flushed > settings.METRICS_FLUSH_INTERVAL:
+            self.flush()
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'histograms': [
+                    [list(key), dict(value, buckets=list(value['buckets']))]
+                    for key, value in self.histograms.items()
+                ],
+                'queries': [
+                    [list(key), value] for key, value in self.queries.items()
+                ],
+            }
+
+    def name(self):
+        pid = os.getpid()
+        if self.pid != pid:
+            self.pid, self.run_id = pid, uuid.uuid4().hex[:12]
+        return f'metrics-{pid}-{self.run_id}.json'
+
+    def path(self):
+        return os.path.join(settings.METRICS_DIR, self.name())
+
+    def is_stale(self, name):
+        """Файл процесса, который уже завершился."""
+        try:
+            pid = int(name.split('-')[1])
+        except (IndexError, ValueError):
+            return True
+        if pid == os.getpid():
+            return name != self.name()
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            pass
+        return False
+
+    def flush(self):
+        """Атомарно записывает гистограммы процесса в его файл."""
+        self.flushed = time.monotonic()
+        if not settings.METRICS_DIR:
+            return
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        path = self.path()
+        temp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'w') as file:
+            json.dump(self.snapshot(), file)
+        os.replace(temp_path, path)
+
+    def collect(self):
+        """Снимки всех воркеров: из файлов или только текущего процесса."""
+        if not settings.METRICS_DIR:
+            return [self.snapshot()]
+        self.flush()
+        snapshots = []
+        for name in os.listdir(settings.METRICS_DIR):
+            if not (name.startswith('metrics-') and name.endswith('.json')):
+                continue
+            path = os.path.join(settings.METRICS_DIR, name)
+            if self.is_stale(name):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            try:
+                with open(path) as file:
+                    snapshots.append(json.load(file))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+
+registry = MetricsRegistry()
+
+
+def can_read_metrics(request):
+    """Bearer-токен METRICS_TOKEN (так ходит Prometheus) или сотрудник."""
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    if settings.METRICS_TOKEN and header.startswith('Bearer '):
+        return hmac.compare_digest(
+            header[len('Bearer '):], settings.METRICS_TOKEN
+        )
+    return request.user.is_staff
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+
+def render_prometheus(snapshots):
+    """Складывает снимки воркеров в текстовый формат Prometheus."""
+    histograms = defaultdict(new_histogram)
+    queries = defaultdict(int)
+    for snapshot in snapshots:
+        for key, value in snapshot['histograms']:
+            total = histograms[tuple(key)]
+            for index, count in enumerate(value['buckets']):
+                total['buckets'][index] += count
+            total['sum'] += value['sum']
+            total['count'] += value['count']
+        for key, value in snapshot['queries']:
+            queries[tuple(key)] += value
+
+    lines = []
+    for name, description in HISTOGRAMS.items():
+        metric = f'{PREFIX}_{name}_seconds'
+        lines.append(f'# HELP {metric} {description}')
+        lines.append(f'# TYPE {metric} histogram')
+        for (histogram_name, route, method), value in sorted(
+            histograms.items()
+        ):
+            if histogram_name != name:
+                continue
+            labels = f'route="{escape(route)}",method="{escape(method)}"'
+            for bound, count in zip(BUCKETS, value['buckets']):
+                lines.append(
+                    f'{metric}_bucket{{{labels},le="{bound}"}} {count}'
+                )
+            lines.append(
+                f'{metric}_bucket{{{labels},le="+Inf"}} {value["count"]}'
+            )
+            lines.append(f'{metric}_sum{{{labels}}} {value["sum"]}')
+            lines.append(f'{metric}_count{{{labels}}} {value["count"]}')
+    metric = f'{PREFIX}_db_queries_total'
+    lines.append(f'# HELP {metric} Число SQL-запросов')
+    lines.append(f'# TYPE {metric} counter')
+    for (route, method), value in sorted(queries.items()):
+        labels = f'route="{escape(route)}",method="{escape(method)}"'
+        lines.append(f'{metric}{{{labels}}} {value}')
+    return '\n'.join(lines) + '\n'
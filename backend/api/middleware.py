@@ -0,0 +1,64 @@
+import time
+
+from django.conf import settings
+
+from .instrumentation import collect_stats
+from .metrics import registry
+
+
+class ServerTimingMiddleware:
+    """
+    Замеряет, на что ушло время запроса.
+
+    Считает SQL-запросы и их время, время установки соединений с БД,
+    время view, сериализации и рендеринга ответа. Результат отдаётся
+    заголовком Server-Timing и попадает в гистограммы эндпоинта
+    /api/metrics/.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        request._timing = {}
+        with collect_stats() as stats:
+            response = self.get_response(request)
+        timing = request._timing
+        now = time.perf_counter()
+        view_started = timing.get('view_started', now)
+        render_started = timing.get('render_started')
+        render_finished = timing.get('render_finished', now)
+        timings = {
+            'total': now - started,
+            'view': (render_started or now) - view_started,
+            'db': stats.db_time,
+            'connect': stats.connect_time,
+            'serialization': stats.serialization_time,
+            'render': (
+                render_finished - render_started if render_started else 0.0
+            ),
+        }
+        match = request.resolver_match
+        route = match.view_name if match else 'unmatched'
+        registry.observe(route, request.method, timings, stats.queries)
+        if settings.SERVER_TIMING_HEADER:
+            response['Server-Timing'] = ', '.join(
+                f'{name};dur={value * 1000:.1f}'
+                + (f';desc="{stats.queries} queries"' if name == 'db' else '')
+                for name, value in timings.items()
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._timing['view_started'] = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        timing = request._timing
+        timing['render_started'] = time.perf_counter()
+
+        def render_finished(response):
+            timing['render_finished'] = time.perf_counter()
+
+        response.add_post_render_callback(render_finished)
+        return response
@@ -0,0 +1,156 @@
+import logging
+import os
+import re
+import sys
+from collections import Counter
+from contextlib import ContextDecorator, ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework.serializers import Serializer
+
+from . import instrumentation, middleware
+
+logger = logging.getLogger(__name__)
+
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+IN_LIST_RE = re.compile(r'\bIN\s*\((?:\s*(?:%s|\?)\s*,?)+\)', re.IGNORECASE)
+SPACES_RE = re.compile(r'\s+')
+# Кадры интерпретатора и установленных пакетов пропускаются.
+LIBRARY_PREFIXES = tuple({sys.prefix, sys.base_prefix, sys.exec_prefix})
+# Обёртки, через которые проходят все запросы, о месте вызова не говорят.
+SKIPPED_FILES = {__file__, instrumentation.__file__, middleware.__file__}
+
+
+class NPlusOneError(AssertionError):
+    """Одинаковый SQL-запрос повторился из одного места слишком много раз."""
+
+
+def fingerprint(sql):
+    """Приводит SQL к виду без литералов, чтобы сравнивать структуру."""
+    sql = STRING_RE.sub('?', sql)
+    sql = NUMBER_RE.sub('?', sql)
+    sql = IN_LIST_RE.sub('IN (...)', sql)
+    return SPACES_RE.sub(' ', sql).strip()
+
+
+def serializer_field(frame):
+    """Поле сериализатора, которое заполняется в кадре to_representation."""
+    if frame.f_code.co_name != 'to_representation':
+        return None
+    serializer = frame.f_locals.get('self')
+    field = frame.f_locals.get('field')
+    if not isinstance(serializer, Serializer) or field is None:
+        return None
+    return f'{type(serializer).__name__}.{field.field_name}'
+
+
+def call_site():
+    """
+    Место в коде проекта, откуда пришёл запрос.
+
+    Это ближайший кадр стека вне библиотек или, если раньше
+    встретилось заполнение поля сериализатора, имя этого поля.
+    """
+    root = os.path.dirname(settings.BASE_DIR)
+    frame = sys._getframe(2)
+    field = site = None
+    while frame is not None and site is None and field is None:
+        field = serializer_field(frame)
+        filename = frame.f_code.co_filename
+        if (
+            filename not in SKIPPED_FILES
+            and not filename.startswith(LIBRARY_PREFIXES)
+            and not filename.startswith('<')
+        ):
+            site = (
+                f'{os.path.relpath(filename, root)}:'
+                f'{frame.f_lineno} {frame.f_code.co_name}'
+            )
+        frame = frame.f_back
+    return field or site or 'unknown'
+
+
+class detect_n_plus_one(ContextDecorator):
+    """
+    Ищет N+1 запросы внутри блока with или декорированной функции.
+
+    Запросы группируются по структуре SQL и месту вызова в коде
+    проекта (например, api/serializers.py:140 get_is_favorited).
+    Группа, повторившаяся больше threshold раз, считается N+1:
+    при action='raise' бросается NPlusOneError, при 'log' пишется
+    предупреждение в лог.
+
+        @detect_n_plus_one(threshold=3)
+        def test_recipes_list(self):
+            ...
+    """
+
+    def __init__(self, threshold=None, action='raise', label=''):
+        if threshold is None:
+            threshold = settings.NPLUSONE_THRESHOLD
+        self.threshold = threshold
+        self.action = action
+        self.label = label
+
+    def execute(self, execute, sql, params, many, context):
+        self.counter[(fingerprint(sql), call_site())] += 1
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self.counter = Counter()
+        self.stack = ExitStack()
+        for connection in connections.all():
+            self.stack.enter_context(
+                connection.execute_wrapper(self.execute)
+            )
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.stack.close()
+        if exc_type is None:
+            self.report()
+        return False
+
+    def problems(self):
+        return [
+            (count, sql, site)
+            for (sql, site), count in self.counter.most_common()
+            if count > self.threshold
+        ]
+
+    def report(self):
+        problems = self.problems()
+        if not problems:
+            return
+        message = '\n'.join(
+            f'{count}x {site}: {sql}' for count, sql, site in problems
+        )
+        message = f'N+1 запросы {self.label}:\n{message}'
+        if self.action == 'raise':
+            raise NPlusOneError(message)
+        logger.warning(message)
+
+
+class NPlusOneMiddleware:
+    """
+    Включает detect_n_plus_one для каждого запроса.
+
+    Работает, только если в настройках NPLUSONE_DETECTION равно
+    'log' или 'raise'; в продакшене по умолчанию выключен.
+    """
+
+    def __init__(self, get_response):
+        if settings.NPLUSONE_DETECTION not in ('log', 'raise'):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        detector = detect_n_plus_one(action=settings.NPLUSONE_DETECTION)
+        with detector:
+            response = self.get_response(request)
+            match = request.resolver_match
+            detector.label = f'в {match.view_name if match else request.path}'
+        return response
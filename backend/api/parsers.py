@@ -0,0 +1,48 @@
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import FileUploadParser, JSONParser
+from rest_framework.settings import api_settings
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class ImageUploadParser(FileUploadParser):
+    """
+    Парсер для загрузки картинки телом запроса.
+
+    Файл пишется на диск загрузчиками Django по мере чтения запроса.
+    Имя файла можно не передавать: оно строится по Content-Type.
+    """
+
+    def get_filename(self, stream, media_type, parser_context):
+        filename = super().get_filename(stream, media_type, parser_context)
+        if filename:
+            return filename
+        subtype = media_type.split(';')[0].split('/')[-1].strip()
+        return f'upload.{subtype or "bin"}'
+
+
+class FastJSONParser(JSONParser):
+    """
+    JSONParser на orjson, без него — стандартный JSONParser.
+
+    orjson, как и JSONParser при STRICT_JSON, не принимает NaN
+    и Infinity.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if (
+            orjson is None
+            or not api_settings.STRICT_JSON
+            or encoding.lower().replace('-', '') != 'utf8'
+        ):
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except ValueError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
@@ -0,0 +1,127 @@
+import cProfile
+import hmac
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+ROUTE_RE = re.compile(r'[^\w.-]+')
+
+
+def frame_name(frame):
+    code = frame.f_code
+    return f'{code.co_name} ({os.path.basename(code.co_filename)})'
+
+
+class StackSampler:
+    """
+    Сэмплирующий профайлер одного потока.
+
+    Фоновый поток раз в interval секунд снимает стек профилируемого
+    потока и считает одинаковые стеки в свёрнутом виде
+    "main;view;serializer" — формат flamegraph.pl и speedscope.
+    """
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                names.append(frame_name(frame))
+                frame = frame.f_back
+            if names:
+                self.stacks[';'.join(reversed(names))] += 1
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def dump(self, path):
+        with open(path, 'w') as file:
+            for stack, count in self.stacks.items():
+                file.write(f'{stack} {count}\n')
+
+
+def route_dir(request):
+    match = request.resolver_match
+    route = match.view_name if match else 'unmatched'
+    path = os.path.join(settings.PROFILING_DIR, ROUTE_RE.sub('_', route))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def trim_ring(path, keep):
+    """Оставляет в каталоге маршрута только keep последних профилей."""
+    files = sorted(os.listdir(path))
+    for name in files[:max(0, len(files) - keep)]:
+        try:
+            os.remove(os.path.join(path, name))
+        except FileNotFoundError:
+            pass
+
+
+class ProfilingMiddleware:
+    """
+    Профилирует часть живых запросов.
+
+    Профилируется доля PROFILING_SAMPLE_RATE запросов и каждый запрос
+    с заголовком X-Profile, равным PROFILING_TOKEN. В режиме
+    'cprofile' пишется дамп pstats, в режиме 'sampler' — свёрнутые
+    стеки. Профили складываются в PROFILING_DIR/<маршрут>/, где
+    хранится не больше PROFILING_MAX_FILES последних файлов.
+    Сводку строит команда profile_report.
+    """
+
+    def __init__(self, get_response):
+        if not (settings.PROFILING_SAMPLE_RATE or settings.PROFILING_TOKEN):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def should_profile(self, request):
+        token = request.META.get('HTTP_X_PROFILE')
+        if token and settings.PROFILING_TOKEN:
+            return hmac.compare_digest(token, settings.PROFILING_TOKEN)
+        return random.random() < settings.PROFILING_SAMPLE_RATE
+
+    def __call__(self, request):
+        if not self.should_profile(request):
+            return self.get_response(request)
+        name = f'{time.time_ns()}-{os.getpid()}'
+        if settings.PROFILING_MODE == 'sampler':
+            sampler = StackSampler(
+                threading.get_ident(), settings.PROFILING_SAMPLER_INTERVAL
+            )
+            sampler.start()
+            try:
+                response = self.get_response(request)
+            finally:
+                sampler.stop()
+            path = route_dir(request)
+            sampler.dump(os.path.join(path, f'{name}.collapsed'))
+        else:
+            profile = cProfile.Profile()
+            profile.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profile.disable()
+            path = route_dir(request)
+            profile.dump_stats(os.path.join(path, f'{name}.pstats'))
+        trim_ring(path, settings.PROFILING_MAX_FILES)
+        return response
@@ -0,0 +1,218 @@
+import json
+from collections import defaultdict
+
+from django.db.models import Count, OuterRef, Subquery
+
+from .fields import absolute_variant_urls
+from .serializers import AuthorShortSerializer, RecipeSerializer
+from .viewer_ids import get_viewer_ids
+from recipes.models import Recipe, SimilarRecipe
+from users.models import Follow, User
+
+RECIPE_FIELDS = RecipeSerializer.Meta.fields
+AUTHOR_FIELDS = (
+    'email', 'id', 'username', 'first_name', 'last_name', 'is_subscribed'
+)
+AUTHOR_SHORT_FIELDS = AuthorShortSerializer.Meta.fields
+SHORT_RECIPE_COLUMNS = (
+    'id', 'name', 'image', 'image_variants', 'cooking_time', 'author_id'
+)
+USER_COLUMNS = ('email', 'id', 'username', 'first_name', 'last_name')
+SIMILAR_COLUMNS = (
+    'similar_id', 'similar__name', 'similar__image',
+    'similar__image_variants', 'similar__cooking_time'
+)
+
+
+def group_by(rows, key):
+    groups = defaultdict(list)
+    for row in rows:
+        groups[row[key]].append(row)
+    return groups
+
+
+def viewer_ids(request, model, field, values):
+    """Значения field в строках model текущего пользователя."""
+    user = getattr(request, 'user', None)
+    if user is None or user.is_anonymous or not values:
+        return set()
+    return set(
+        model.objects.filter(user=user, **{f'{field}__in': values})
+        .order_by().values_list(field, flat=True)
+    )
+
+
+def image_url(name, request=None):
+    """Ссылка на картинку рецепта, как её отдаёт ImageField."""
+    if not name:
+        return None
+    url = Recipe._meta.get_field('image').storage.url(name)
+    return request.build_absolute_uri(url) if request is not None else url
+
+
+def short_recipe(row, request=None):
+    """Рецепт в виде CreateResponseSerializer."""
+    storage = Recipe._meta.get_field('image').storage
+    return {
+        'id': row['id'],
+        'name': row['name'],
+        'image': image_url(row['image'], request),
+        'images': absolute_variant_urls(
+            row['image'], row['image_variants'] == row['image'], storage,
+            request
+        ),
+        'cooking_time': row['cooking_time'],
+    }
+
+
+def user_dict(row, is_subscribed, fields=AUTHOR_FIELDS):
+    """Пользователь в виде CustomUserSerializer или его части fields."""
+    return {
+        name: is_subscribed if name == 'is_subscribed' else row[name]
+        for name in fields
+    }
+
+
+def recipe_columns(fields=RECIPE_FIELDS):
+    """Столбцы Recipe, нужные для полей fields."""
+    columns = ['id']
+    if 'author' in fields:
+        columns.append('author_id')
+    if 'image' in fields or 'images' in fields:
+        columns.append('image')
+    if 'images' in fields:
+        columns.append('image_variants')
+    if 'ingredients' in fields:
+        columns.append('ingredients_snapshot')
+    columns.extend(
+        name for name in ('name', 'text', 'cooking_time') if name in fields
+    )
+    return columns
+
+
+def get_authors(rows, request, fields):
+    author_ids = {row['author_id'] for row in rows}
+    columns = [name for name in fields if name != 'is_subscribed']
+    subscribed = (
+        viewer_ids(request, Follow, 'following_id', author_ids)
+        if 'is_subscribed' in fields else set()
+    )
+    return {
+        author['id']: user_dict(author, author['id'] in subscribed, fields)
+        for author in User.objects.filter(id__in=author_ids)
+        .order_by().values(*columns)
+    }
+
+
+def get_tags(ids):
+    """Теги рецептов ids: {id рецепта: [тег, ...]}."""
+    tags = defaultdict(list)
+    rows = (
+        Recipe.tags.through.objects.filter(recipe_id__in=ids)
+        .order_by('tag_id')
+        .values_list(
+            'recipe_id', 'tag_id', 'tag__name', 'tag__color', 'tag__slug'
+        )
+    )
+    for recipe_id, tag_id, name, color, slug in rows:
+        tags[recipe_id].append(
+            {'id': tag_id, 'name': name, 'color': color, 'slug': slug}
+        )
+    return tags
+
+
+def recipe_list(rows, request, fields=RECIPE_FIELDS,
+                author_fields=AUTHOR_FIELDS):
+    """
+    Рецепты в виде RecipeSerializer по строкам .values(*recipe_columns()).
+
+    Авторы и теги выбираются по одному запросу на всю страницу
+    и собираются в словари без создания моделей и сериализаторов,
+    ингредиенты берутся из копии ingredients_snapshot, флаги — из кэша
+    get_viewer_ids. Связанные данные полей, которых нет в fields,
+    не запрашиваются.
+    """
+    ids = [row['id'] for row in rows]
+    authors = (
+        get_authors(rows, request, author_fields) if 'author' in fields
+        else {}
+    )
+    tags = get_tags(ids) if 'tags' in fields else {}
+    favorited = get_viewer_ids(request, 'favorites')
+    in_cart = get_viewer_ids(request, 'shopping_cart')
+    storage = Recipe._meta.get_field('image').storage
+    getters = {
+        'tags': lambda row: tags.get(row['id'], []),
+        'author': lambda row: authors[row['author_id']],
+        'ingredients': lambda row: json.loads(row['ingredients_snapshot']),
+        'is_favorited': lambda row: row['id'] in favorited,
+        'is_in_shopping_cart': lambda row: row['id'] in in_cart,
+        'image': lambda row: image_url(row['image'], request),
+        'images': lambda row: absolute_variant_urls(
+            row['image'], row['image_variants'] == row['image'], storage,
+            request
+        ),
+    }
+    return [
+        {
+            name: getters[name](row) if name in getters else row[name]
+            for name in fields
+        }
+        for row in rows
+    ]
+
+
+def latest_recipes(recipes_limit):
+    """Не больше recipes_limit последних рецептов каждого автора."""
+    latest = Recipe.objects.filter(
+        author_id=OuterRef('author_id')
+    ).values('id')[:int(recipes_limit)]
+    return Recipe.objects.filter(id__in=Subquery(latest))
+
+
+def subscription_list(rows, recipes_limit):
+    """
+    Подписки в виде SubscriptionShowSerializer по строкам
+    .values(*USER_COLUMNS).
+
+    Двумя запросами на страницу: число рецептов авторов и не больше
+    recipes_limit последних рецептов каждого автора (коррелированный
+    подзапрос с LIMIT по индексу recipe_author_pub_date_idx), без
+    выборки всех рецептов плодовитых авторов.
+    """
+    author_ids = [row['id'] for row in rows]
+    counts = dict(
+        Recipe.objects.filter(author_id__in=author_ids).order_by()
+        .values_list('author_id').annotate(Count('id'))
+    )
+    recipes = group_by(
+        latest_recipes(recipes_limit).filter(author_id__in=author_ids)
+        .values(*SHORT_RECIPE_COLUMNS),
+        'author_id'
+    )
+    return [
+        dict(
+            # В подписках текущего пользователя все авторы подписаны.
+            user_dict(row, True),
+            recipes=[short_recipe(recipe) for recipe in recipes[row['id']]],
+            recipes_count=counts.get(row['id'], 0),
+        )
+        for row in rows
+    ]
+
+
+def similar_recipes(recipe_id, request):
+    """Похожие рецепты в виде CreateResponseSerializer одним запросом."""
+    rows = (
+        SimilarRecipe.objects.filter(recipe_id=recipe_id)
+        .order_by('-score').values_list(*SIMILAR_COLUMNS)
+    )
+    return [
+        short_recipe(
+            dict(zip(
+                ('id', 'name', 'image', 'image_variants', 'cooking_time'), row
+            )),
+            request
+        )
+        for row in rows
+    ]
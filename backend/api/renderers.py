@@ -0,0 +1,60 @@
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Как и JSONRenderer, экранируем разделители строк для совместимости с JS.
+LINE_SEPARATORS = (
+    ('\u2028'.encode(), b'\\u2028'),
+    ('\u2029'.encode(), b'\\u2029'),
+)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer на orjson.
+
+    Вывод совпадает с JSONRenderer: компактный UTF-8, даты и время
+    в том же формате, Decimal как число, ленивые строки как строки.
+    Отличается только запись float в экспоненциальной форме: orjson
+    пишет 1e-05 как 0.00001 и 1e+16 как 1e16, значения при разборе
+    те же. Без orjson, с отступами, при нестандартных UNICODE_JSON,
+    COMPACT_JSON или STRICT_JSON и для целых шире 64 бит, которые
+    orjson не пишет, работает обычный JSONRenderer.
+    """
+
+    encoder = JSONEncoder()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if (
+            orjson is None
+            or self.ensure_ascii
+            or not self.compact
+            or not api_settings.STRICT_JSON
+            or self.get_indent(accepted_media_type, renderer_context or {})
+        ):
+            return super().render(
+                data, accepted_media_type, renderer_context
+            )
+        try:
+            content = orjson.dumps(
+                data,
+                default=self.encoder.default,
+                option=(
+                    orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+                ),
+            )
+        except orjson.JSONEncodeError:
+            return super().render(
+                data, accepted_media_type, renderer_context
+            )
+        for separator, escaped in LINE_SEPARATORS:
+            if separator in content:
+                content = content.replace(separator, escaped)
+        return content
@@ -1,22 +1,38 @@
+import json
+
+from django.db import transaction
+from django.http import QueryDict
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from rest_framework.serializers import (
+    ChoiceField,
+    JSONField,
     ModelSerializer,
     PrimaryKeyRelatedField,
-    ReadOnlyField,
+    RegexField,
+    Serializer,
     SerializerMethodField,
+    UUIDField,
     ValidationError
 )
 from rest_framework.validators import UniqueTogetherValidator
 
-from .fields import Base64ImageField, Hex2NameColor
+from .fields import (
+    Base64ImageField,
+    Hex2NameColor,
+    ImageVariantsField,
+    JSONTextField
+)
+from .viewer_ids import get_following_ids, get_viewer_ids
 from recipes.models import (
     Favorite,
+    ImageUpload,
     Ingredient,
     IngredientRecipe,
     Recipe,
     ShoppingCart,
     Tag
 )
+from recipes.snapshots import refresh_snapshot
 from users.models import Follow, User
 
 
@@ -45,10 +61,9 @@ class CustomUserSerializer(UserSerializer):
         Ответ True или False.
         """
         request = self.context.get('request')
-        if not request or request.user.is_anonymous:
+        if not request:
             return False
-        return Follow.objects.filter(
-            user=request.user, following=obj).exists()
+        return obj.id in get_following_ids(request)
 
 
 class CustomUserCreateSerializer(UserCreateSerializer):
@@ -62,6 +77,14 @@ class CustomUserCreateSerializer(UserCreateSerializer):
         )
 
 
+class AuthorShortSerializer(ModelSerializer):
+    """Автор рецепта в компактном виде."""
+
+    class Meta:
+        model = User
+        fields = ('id', 'username', 'first_name', 'last_name')
+
+
 class TagSerializer(ModelSerializer):
     """Сериализатор для модели Tag."""
 
@@ -83,41 +106,22 @@ class IngredientSerializer(ModelSerializer):
         fields = '__all__'
 
 
-class GetIngredientRecipeSerializer(ModelSerializer):
-    """Сериализатор для модели IngredientRecipe."""
-
-    id = ReadOnlyField(source="ingredient.id")
-    name = ReadOnlyField(source='ingredient.name')
-    measurement_unit = ReadOnlyField(
-        source='ingredient.measurement_unit'
-    )
-
-    class Meta:
-        model = IngredientRecipe
-        fields = (
-            'id',
-            'name',
-            'measurement_unit',
-            'amount'
-        )
-
-
 class RecipeSerializer(ModelSerializer):
     """
     Сериализатор для модели Recipe.
 
-    Служит для безопасных запросов к recipes.
+    Служит для безопасных запросов к recipes. Ингредиенты берутся
+    из копии Recipe.ingredients_snapshot без join. В контексте можно
+    передать fields — какие поля отдавать, и compact — отдавать
+    автора в виде AuthorShortSerializer.
     """
 
     tags = TagSerializer(many=True, read_only=True)
     author = CustomUserSerializer(read_only=True)
-    ingredients = GetIngredientRecipeSerializer(
-        source='ingredient_amounts',
-        many=True,
-        read_only=True
-    )
+    ingredients = JSONTextField(source='ingredients_snapshot')
     is_in_shopping_cart = SerializerMethodField(read_only=True)
     is_favorited = SerializerMethodField(read_only=True)
+    images = ImageVariantsField(source='image')
 
     class Meta:
         model = Recipe
@@ -125,30 +129,43 @@ class RecipeSerializer(ModelSerializer):
         fields = (
             'id', 'tags', 'author', 'ingredients',
             'is_favorited', 'is_in_shopping_cart',
-            'name', 'image', 'text', 'cooking_time',
+            'name', 'image', 'images', 'text', 'cooking_time',
+        )
+        compact_fields = (
+            'id', 'author', 'is_favorited', 'is_in_shopping_cart',
+            'name', 'image', 'cooking_time',
         )
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = self.context.get('fields')
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+        if self.context.get('compact') and 'author' in self.fields:
+            self.fields['author'] = AuthorShortSerializer(read_only=True)
+
     def get_is_favorited(self, object):
         """Возвращает bool value на запрос есть рецепт в избранном."""
-        request = self.context.get('request')
-        if request is None or request.user.is_anonymous:
-            return False
-        return request.user.favorit_user.filter(recipe=object).exists()
+        return object.id in get_viewer_ids(
+            self.context.get('request'), 'favorites'
+        )
 
     def get_is_in_shopping_cart(self, object):
         """Возвращает bool value на запрос есть рецепт в списке покупок."""
-        request = self.context.get('request')
-        if request is None or request.user.is_anonymous:
-            return False
-        return request.user.shopping_cart.filter(recipe=object).exists()
+        return object.id in get_viewer_ids(
+            self.context.get('request'), 'shopping_cart'
+        )
 
 
 class CreateResponseSerializer(ModelSerializer):
     """Короткий отображение рецептов при создании подписки."""
 
+    images = ImageVariantsField(source='image')
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'images', 'cooking_time')
 
 
 class FollowListSerializer(CustomUserSerializer):
@@ -220,9 +237,38 @@ class CreateRecipeSerializer(ModelSerializer):
     """
 
     image = Base64ImageField(required=False, allow_null=True)
+    image_token = UUIDField(required=False, write_only=True)
     tags = PrimaryKeyRelatedField(many=True, queryset=Tag.objects.all())
     ingredients = CreateIngredientRecipeSerializer(many=True)
 
+    def to_internal_value(self, data):
+        """Приводит данные multipart/form-data к виду JSON-запроса."""
+        if isinstance(data, QueryDict):
+            data = self.parse_form_data(data)
+        return super().to_internal_value(data)
+
+    @staticmethod
+    def parse_form_data(data):
+        """
+        Разбирает списки тегов и ингредиентов из формы.
+
+        Их можно передать повторяющимися полями
+        или одним полем со списком в JSON.
+        """
+        parsed = data.dict()
+        for key in ('tags', 'ingredients'):
+            values = []
+            for value in data.getlist(key):
+                try:
+                    values.append(json.loads(value))
+                except ValueError:
+                    values.append(value)
+            if len(values) == 1 and isinstance(values[0], list):
+                values = values[0]
+            if key in data:
+                parsed[key] = values
+        return parsed
+
     def to_representation(self, value):
         """Сериализация данных при помощи RecipeSerializer."""
         return RecipeSerializer(
@@ -251,6 +297,25 @@ class CreateRecipeSerializer(ModelSerializer):
             )
         return tags
 
+    def validate_image_token(self, token):
+        """Проверяем, что картинку загрузил текущий пользователь."""
+        upload = ImageUpload.objects.filter(
+            token=token,
+            user=self.context.get('request').user,
+            created__gte=ImageUpload.expires_before()
+        ).first()
+        if upload is None:
+            raise ValidationError('Загруженное изображение не найдено')
+        return upload
+
+    @staticmethod
+    def pop_image_upload(validated_data):
+        """Подставляет в рецепт картинку, загруженную по токену."""
+        upload = validated_data.pop('image_token', None)
+        if upload is not None:
+            validated_data['image'] = upload.image.name
+            upload.delete()
+
     def add_ingredients(self, ingredients_data, recipe):
         """Добавляет в рецепты ингредиенты."""
         IngredientRecipe.objects.bulk_create([
@@ -262,6 +327,7 @@ class CreateRecipeSerializer(ModelSerializer):
             for ingredient in ingredients_data
         ])
 
+    @transaction.atomic
     def create(self, validated_data):
         """
         Кастомный метод create.
@@ -269,13 +335,16 @@ class CreateRecipeSerializer(ModelSerializer):
         Создан, чтобы подгрузить автора, теги и ингредиенты.
         """
         author = self.context.get('request').user
+        self.pop_image_upload(validated_data)
         tags_data = validated_data.pop('tags')
         ingredients_data = validated_data.pop('ingredients')
         recipe = Recipe.objects.create(**validated_data, author=author)
         recipe.tags.set(tags_data)
         self.add_ingredients(ingredients_data, recipe)
+        refresh_snapshot(recipe)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         """
         Кастомный метод update.
@@ -283,6 +352,7 @@ class CreateRecipeSerializer(ModelSerializer):
         Создан, чтобы подгрузить автора, теги и ингредиенты.
         """
         recipe = instance
+        self.pop_image_upload(validated_data)
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
         super().update(instance, validated_data)
@@ -291,6 +361,7 @@ class CreateRecipeSerializer(ModelSerializer):
         instance.tags.set(tags)
         IngredientRecipe.objects.filter(recipe=recipe).delete()
         self.add_ingredients(ingredients, recipe)
+        refresh_snapshot(recipe)
         return instance
 
     class Meta:
@@ -299,12 +370,23 @@ class CreateRecipeSerializer(ModelSerializer):
             'ingredients',
             'tags',
             'image',
+            'image_token',
             'name',
             'text',
             'cooking_time'
         )
 
 
+class ImageUploadSerializer(ModelSerializer):
+    """Сериализатор для картинки, загруженной отдельным запросом."""
+
+    image = Base64ImageField(write_only=True)
+
+    class Meta:
+        model = ImageUpload
+        fields = ('token', 'image')
+
+
 class FavoriteSerializer(ModelSerializer):
     """Сериализатор для модели Избранного."""
 
@@ -356,12 +438,25 @@ class SubscriptionShowSerializer(CustomUserSerializer):
 
     def get_recipes(self, object):
         """Возвращает рецепты в подписках с использованием лимита."""
-        recipes_limit = self.context.get('recipes_limit')
-        author_recipes = object.recipes.all()[:int(recipes_limit)]
+        author_recipes = getattr(object, 'latest_recipes', None)
+        if author_recipes is None:
+            recipes_limit = self.context.get('recipes_limit')
+            author_recipes = object.recipes.all()[:int(recipes_limit)]
         return CreateResponseSerializer(
             author_recipes, many=True
         ).data
 
     def get_recipes_count(self, object):
         """Сообщает количество рецептов при get запросе к подпискам."""
-        return object.recipes.count()
+        count = getattr(object, 'recipes_count', None)
+        if count is None:
+            count = object.recipes.count()
+        return count
+
+
+class BatchRequestSerializer(Serializer):
+    """Подзапрос в /api/batch/."""
+
+    method = ChoiceField(choices=('GET', 'POST', 'PUT', 'PATCH', 'DELETE'))
+    path = RegexField(r'^/api/', max_length=2000)
+    body = JSONField(required=False)
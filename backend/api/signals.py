@@ -0,0 +1,94 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from foodgram.invalidation import bus
+
+from .authentication import invalidate_token
+from .http_cache import purge
+from .viewer_ids import refresh_ids
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from users.models import Follow
+
+
+def drop_tokens(keys):
+    """
+    Убирает токены из кэшей сразу и ещё раз после коммита.
+
+    До коммита параллельный запрос видит в БД старые токен и
+    пользователя и может снова положить их в общий кэш.
+    """
+    for key in keys:
+        invalidate_token(key)
+
+    def committed():
+        for key in keys:
+            invalidate_token(key)
+        bus.bump('auth')
+
+    transaction.on_commit(committed)
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    """Выход через djoser удаляет токен: убираем его из кэша."""
+    drop_tokens([instance.key])
+
+
+@receiver(post_save, sender=get_user_model())
+def user_saved(sender, instance, update_fields, **kwargs):
+    """Смена пароля, деактивация и т.п.: пользователь в кэше устарел."""
+    if update_fields and set(update_fields) <= {'last_login'}:
+        # Вход сохраняет только last_login: кэши сбрасывать незачем.
+        return
+    drop_tokens(list(
+        Token.objects.filter(user=instance).values_list('key', flat=True)
+    ))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tag_changed(sender, **kwargs):
+    def changed():
+        bus.bump('tags')
+        purge('/api/tags/', '/api/recipes/')
+
+    transaction.on_commit(changed)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredient_changed(sender, **kwargs):
+    transaction.on_commit(lambda: purge('/api/ingredients/'))
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    """Рецепт изменился: обновляем его страницу и первую страницу списка."""
+    paths = ('/api/recipes/', f'/api/recipes/{instance.pk}/')
+
+    def changed():
+        bus.bump('recipes')
+        purge(*paths)
+
+    transaction.on_commit(changed)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+def viewer_list_changed(sender, instance, **kwargs):
+    """Изменилось избранное или список покупок: пересобираем массив id."""
+    kind = 'favorites' if sender is Favorite else 'shopping_cart'
+    user_id = instance.user_id
+    transaction.on_commit(lambda: refresh_ids(kind, user_id))
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def follow_changed(sender, **kwargs):
+    transaction.on_commit(lambda: bus.bump('follows'))
@@ -6,7 +6,10 @@ from .views import (
     IngredientViewSet,
     RecipeViewSet,
     TagViewSet,
-    UsersViewSet
+    UsersViewSet,
+    batch,
+    bootstrap,
+    metrics
 )
 
 v1_router = routers.DefaultRouter()
@@ -18,6 +21,9 @@ v1_router.register('tags', TagViewSet, basename='tags')
 app_name = 'api'
 
 urlpatterns = [
+    path('metrics/', metrics, name='metrics'),
+    path('bootstrap/', bootstrap, name='bootstrap'),
+    path('batch/', batch, name='batch'),
     path('', include(v1_router.urls)),
     path('', include('djoser.urls')),
     re_path(r"^auth/token/login/?$",
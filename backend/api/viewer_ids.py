@@ -0,0 +1,122 @@
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import cache
+
+from foodgram.invalidation import bus
+
+from .caches import LocalTTLCache
+from recipes.models import Favorite, ShoppingCart
+from users.models import Follow
+
+KINDS = {'favorites': Favorite, 'shopping_cart': ShoppingCart}
+# Массивы, которые общий кэш отказался хранить из-за размера.
+local_ids = LocalTTLCache(
+    settings.VIEWER_IDS_LOCAL_SIZE, settings.VIEWER_IDS_TTL
+)
+
+
+class RecipeIdSet:
+    """Отсортированный массив id рецептов, 4 байта на рецепт."""
+
+    def __init__(self, data=b''):
+        self.ids = array('I')
+        self.ids.frombytes(data)
+
+    def __contains__(self, recipe_id):
+        index = bisect_left(self.ids, recipe_id)
+        return index < len(self.ids) and self.ids[index] == recipe_id
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def version_key(kind, user_id):
+    return f'viewer-ids-version:{kind}:{user_id}'
+
+
+def ids_key(kind, user_id, version):
+    if not bus.store.shared_cache:
+        # Кэш Django свой у каждого воркера: о новой версии списка
+        # пользователя другие воркеры узнают из хранилища шины.
+        version = f'{version}:{bus.key_version(kind, user_id)}'
+    return f'viewer-ids:{kind}:{user_id}:{version}'
+
+
+def build_ids(kind, user_id):
+    ids = (
+        KINDS[kind].objects.filter(user_id=user_id)
+        .order_by('recipe_id').values_list('recipe_id', flat=True)
+    )
+    return array('I', ids).tobytes()
+
+
+def store_ids(key, data):
+    """
+    Кладёт массив в общий кэш, а не влезший — в кэш процесса.
+
+    Ключ содержит версию из общего кэша, поэтому копия в процессе
+    устаревает вместе с ней. Бэкенды Django, кроме SharedMemoryCache,
+    из set ничего не возвращают.
+    """
+    if cache.set(key, data, settings.VIEWER_IDS_TTL) is False:
+        local_ids.set(key, data)
+
+
+def load_ids(kind, user_id):
+    """Id рецептов в избранном или списке покупок пользователя из кэша."""
+    version = cache.get(version_key(kind, user_id))
+    if version is None:
+        cache.add(version_key(kind, user_id), 1, None)
+        version = cache.get(version_key(kind, user_id))
+    key = ids_key(kind, user_id, version)
+    data = local_ids.get(key)
+    if data is None:
+        data = cache.get(key)
+    if data is None:
+        data = build_ids(kind, user_id)
+        store_ids(key, data)
+    return RecipeIdSet(data)
+
+
+def refresh_ids(kind, user_id):
+    """
+    Пересобирает массив после коммита изменения.
+
+    Версия увеличивается атомарным incr уже после коммита, поэтому
+    массив, собранный по старому состоянию БД, под новой версией
+    оказаться не может.
+    """
+    try:
+        version = cache.incr(version_key(kind, user_id))
+    except ValueError:
+        cache.add(version_key(kind, user_id), 0, None)
+        version = cache.incr(version_key(kind, user_id))
+    if not bus.store.shared_cache:
+        bus.bump_key(kind, user_id)
+    store_ids(ids_key(kind, user_id, version), build_ids(kind, user_id))
+
+
+def get_viewer_ids(request, kind):
+    """Массив текущего пользователя, один раз на запрос."""
+    user = getattr(request, 'user', None)
+    if user is None or user.is_anonymous:
+        return RecipeIdSet()
+    attr = f'_viewer_ids_{kind}'
+    if not hasattr(request, attr):
+        setattr(request, attr, load_ids(kind, user.pk))
+    return getattr(request, attr)
+
+
+def get_following_ids(request):
+    """Id авторов, на которых подписан пользователь, один раз на запрос."""
+    user = getattr(request, 'user', None)
+    if user is None or user.is_anonymous:
+        return set()
+    if not hasattr(request, '_following_ids'):
+        request._following_ids = set(
+            Follow.objects.filter(user=user)
+            .values_list('following_id', flat=True)
+        )
+    return request._following_ids
@@ -1,25 +1,59 @@
-from django.db.models import Sum
+import re
+
+from django.conf import settings as django_settings
+from django.db.models import Count, Prefetch, Sum
+from django.http import (
+    HttpResponse,
+    HttpResponseForbidden,
+    HttpResponseNotModified
+)
 from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_vary_headers
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser import utils, views
 from djoser.conf import settings
 from djoser.views import UserViewSet
 from rest_framework import permissions, status
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.pagination import LimitOffsetPagination
 from rest_framework.permissions import SAFE_METHODS
 from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 
+from .batch import run_subrequest
+from .bootstrap import (
+    get_current_user,
+    get_ingredients_stamp,
+    get_tags,
+    get_viewer_counts
+)
+from .catalog import ingredient_catalog
+from .db_router import ReplicaReadMixin
 from .filters import IngredientSearchFilter, RecipeFilter
+from .http_cache import PublicCacheMixin
+from .metrics import can_read_metrics, registry, render_prometheus
 from .paginations import CustomPagination
+from .parsers import ImageUploadParser
 from .pdf_downloader import create_pdf_file
 from .permissions import IsAuthorOrReadOnly
+from .projections import (
+    AUTHOR_FIELDS,
+    AUTHOR_SHORT_FIELDS,
+    USER_COLUMNS,
+    latest_recipes,
+    recipe_columns,
+    recipe_list,
+    similar_recipes,
+    subscription_list
+)
 from .serializers import (
+    BatchRequestSerializer,
     CreateRecipeSerializer,
     CreateResponseSerializer,
     FavoriteSerializer,
     FollowSerializer,
+    ImageUploadSerializer,
     IngredientSerializer,
     RecipeSerializer,
     ShoppingCartSerializer,
@@ -36,6 +70,12 @@ from recipes.models import (
 )
 from users.models import Follow, User
 
+GZIP_RE = re.compile(r'\bgzip\b')
+
+
+def split_fields(value):
+    return [name.strip() for name in value.split(',') if name.strip()]
+
 
 class CustomTokenCreateView(views.TokenCreateView):
     """Для получения токена."""
@@ -50,7 +90,7 @@ class CustomTokenCreateView(views.TokenCreateView):
         )
 
 
-class TagViewSet(ReadOnlyModelViewSet):
+class TagViewSet(PublicCacheMixin, ReplicaReadMixin, ReadOnlyModelViewSet):
     """Вьюсет для обьектов класса Tag."""
 
     queryset = Tag.objects.all()
@@ -58,7 +98,9 @@ class TagViewSet(ReadOnlyModelViewSet):
     permission_classes = (permissions.AllowAny,)
 
 
-class IngredientViewSet(ReadOnlyModelViewSet):
+class IngredientViewSet(
+    PublicCacheMixin, ReplicaReadMixin, ReadOnlyModelViewSet
+):
     """Вьюсет для обьектов класса Ingredient."""
 
     queryset = Ingredient.objects.all()
@@ -67,8 +109,33 @@ class IngredientViewSet(ReadOnlyModelViewSet):
     filterset_class = IngredientSearchFilter
     permission_classes = (permissions.AllowAny,)
 
+    def list(self, request, *args, **kwargs):
+        """
+        Без фильтров отдаёт готовый каталог из памяти.
+
+        Клиенту, который принимает gzip, уходит заранее сжатая версия;
+        по If-None-Match с совпадающим ETag — ответ 304.
+        """
+        if request.query_params or request.accepted_renderer.format != 'json':
+            return super().list(request, *args, **kwargs)
+        catalog = ingredient_catalog.get()
+        gzipped = GZIP_RE.search(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        etag = catalog.gzip_etag if gzipped else catalog.etag
+        if etag in request.META.get('HTTP_IF_NONE_MATCH', ''):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(
+                catalog.gzipped if gzipped else catalog.content,
+                content_type='application/json'
+            )
+            if gzipped:
+                response['Content-Encoding'] = 'gzip'
+        response['ETag'] = etag
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
 
-class UsersViewSet(UserViewSet):
+
+class UsersViewSet(ReplicaReadMixin, UserViewSet):
     """Вьюсет для подписок, модель Follow."""
 
     pagination_class = LimitOffsetPagination
@@ -78,8 +145,19 @@ class UsersViewSet(UserViewSet):
         """Возвращает авторов, на которых подписан пользователь."""
         recipes_limit = request.query_params['recipes_limit']
         authors = User.objects.filter(following__user=request.user)
+        if django_settings.PROJECTION_READS:
+            rows = self.paginate_queryset(authors.values(*USER_COLUMNS))
+            return self.get_paginated_response(
+                subscription_list(rows, recipes_limit)
+            )
         result_pages = self.paginate_queryset(
-            queryset=authors
+            queryset=authors.annotate(
+                recipes_count=Count('recipes', distinct=True)
+            ).order_by('id').prefetch_related(Prefetch(
+                'recipes',
+                queryset=latest_recipes(recipes_limit),
+                to_attr='latest_recipes'
+            ))
         )
         serializer = SubscriptionShowSerializer(
             result_pages,
@@ -118,7 +196,7 @@ class UsersViewSet(UserViewSet):
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
-class RecipeViewSet(ModelViewSet):
+class RecipeViewSet(PublicCacheMixin, ReplicaReadMixin, ModelViewSet):
     """Вьюсет для модели Recipe."""
 
     queryset = Recipe.objects.all()
@@ -135,6 +213,69 @@ class RecipeViewSet(ModelViewSet):
             return RecipeSerializer
         return CreateRecipeSerializer
 
+    def get_fieldset(self):
+        """
+        Поля рецепта, которые запросил клиент, и признак compact.
+
+        fields задаёт список полей через запятую, omit убирает поля
+        из ответа, view=compact отдаёт только поля для сетки рецептов
+        с коротким автором.
+        """
+        if hasattr(self, '_fieldset'):
+            return self._fieldset
+        params = self.request.query_params
+        meta = RecipeSerializer.Meta
+        compact = params.get('view') == 'compact'
+        fields = meta.compact_fields if compact else meta.fields
+        if 'fields' in params:
+            fields = split_fields(params['fields'])
+        omit = split_fields(params.get('omit', ''))
+        unknown = set(fields).union(omit) - set(meta.fields)
+        if unknown:
+            raise ValidationError(
+                {'fields': f'Неизвестные поля: {", ".join(sorted(unknown))}'}
+            )
+        self._fieldset = (
+            tuple(
+                name for name in meta.fields
+                if name in fields and name not in omit
+            ),
+            compact
+        )
+        return self._fieldset
+
+    def get_queryset(self):
+        """Подгружает связанные объекты только для запрошенных полей."""
+        queryset = super().get_queryset()
+        if self.request.method not in SAFE_METHODS:
+            return queryset
+        fields, compact = self.get_fieldset()
+        if 'author' in fields:
+            queryset = queryset.select_related('author')
+        if 'tags' in fields:
+            queryset = queryset.prefetch_related('tags')
+        return queryset
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.request.method in SAFE_METHODS:
+            context['fields'], context['compact'] = self.get_fieldset()
+        return context
+
+    def list(self, request, *args, **kwargs):
+        """Список рецептов из проекций .values(), без RecipeSerializer."""
+        if not django_settings.PROJECTION_READS:
+            return super().list(request, *args, **kwargs)
+        fields, compact = self.get_fieldset()
+        queryset = self.filter_queryset(self.get_queryset())
+        rows = self.paginate_queryset(
+            queryset.prefetch_related(None).values(*recipe_columns(fields))
+        )
+        return self.get_paginated_response(recipe_list(
+            rows, request, fields,
+            AUTHOR_SHORT_FIELDS if compact else AUTHOR_FIELDS
+        ))
+
     @staticmethod
     def post_method_for_actions(request, pk, serializer_req):
         """Для post запросов к shopping_cart и favorite."""
@@ -180,6 +321,43 @@ class RecipeViewSet(ModelViewSet):
         return self.delete_method_for_actions(request, pk,
                                               'списка покупок', ShoppingCart)
 
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk):
+        """
+        Похожие по ингредиентам рецепты.
+
+        Соседи заранее посчитаны командой build_similar_recipes,
+        здесь только читаются по индексу.
+        """
+        try:
+            recipe_id = int(pk)
+        except ValueError:
+            raise NotFound
+        data = similar_recipes(recipe_id, request)
+        if not data and not Recipe.objects.filter(id=recipe_id).exists():
+            raise NotFound
+        return Response(data)
+
+    @action(
+        detail=False,
+        methods=['post'],
+        permission_classes=(permissions.IsAuthenticated,),
+        parser_classes=(ImageUploadParser,)
+    )
+    def upload_image(self, request):
+        """
+        Принимает картинку рецепта телом запроса.
+
+        Возвращает токен, который передается в поле image_token
+        при создании или изменении рецепта.
+        """
+        serializer = ImageUploadSerializer(
+            data={'image': request.data.get('file')}
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save(user=request.user)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
     @action(
         detail=False,
         methods=['get'],
@@ -198,3 +376,62 @@ class RecipeViewSet(ModelViewSet):
             ).annotate(ingredient_amount_sum=Sum('amount'))
         )
         return create_pdf_file(shopping_cart)
+
+
+def metrics(request):
+    """
+    Гистограммы времени запросов всех воркеров в формате Prometheus.
+
+    Доступны с заголовком Authorization: Bearer <METRICS_TOKEN> или
+    сотрудникам, вошедшим через админку.
+    """
+    if not can_read_metrics(request):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        render_prometheus(registry.collect()),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
+
+
+@api_view(['GET'])
+@permission_classes((permissions.AllowAny,))
+def bootstrap(request):
+    """
+    Данные для первой загрузки страницы одним запросом.
+
+    Теги, текущий пользователь, версия каталога ингредиентов и число
+    рецептов в избранном и списке покупок. Все части берутся из кэша.
+    """
+    return Response({
+        'tags': get_tags(),
+        'user': get_current_user(request.user),
+        'ingredients': get_ingredients_stamp(
+            ingredient_catalog.get(), request
+        ),
+        **get_viewer_counts(request.user),
+    })
+
+
+@api_view(['POST'])
+@permission_classes((permissions.AllowAny,))
+def batch(request):
+    """
+    Выполняет список подзапросов за один HTTP-запрос.
+
+    Тело — массив объектов {"method", "path", "body"}, не больше
+    BATCH_MAX_REQUESTS. Подзапросы выполняются по очереди с
+    аутентификацией основного запроса; ответ — массив
+    {"status", "headers", "body"} в том же порядке. Доступны только
+    viewset'ы из BATCH_ALLOWED_ROUTES, middleware подзапросы не проходят.
+    """
+    limit = django_settings.BATCH_MAX_REQUESTS
+    if isinstance(request.data, list) and len(request.data) > limit:
+        raise ValidationError(f'Не больше {limit} подзапросов в пакете')
+    serializer = BatchRequestSerializer(data=request.data, many=True)
+    serializer.is_valid(raise_exception=True)
+    return Response([
+        run_subrequest(
+            request, item['method'], item['path'], item.get('body')
+        )
+        for item in serializer.validated_data
+    ])
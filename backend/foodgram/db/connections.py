@@ -0,0 +1,81 @@
+import threading
+import time
+
+from api.instrumentation import current_stats
+
+_slots = {}
+_slots_lock = threading.Lock()
+
+
+def get_slots(alias, limit):
+    """Семафор на число открытых соединений процесса с одной БД."""
+    if not limit:
+        return None
+    with _slots_lock:
+        if alias not in _slots:
+            _slots[alias] = threading.BoundedSemaphore(limit)
+        return _slots[alias]
+
+
+class ManagedConnectionMixin:
+    """
+    Управление постоянными соединениями с БД.
+
+    Добавляет к стандартному бэкенду:
+    - CONN_HEALTH_CHECKS: перед первым использованием в новом запросе
+      соединение, оставшееся с прошлых запросов (CONN_MAX_AGE > 0),
+      проверяется и при обрыве открывается заново;
+    - MAX_CONNECTIONS: сколько соединений с этой БД может держать
+      один воркер на все свои потоки, CONNECTION_WAIT — сколько
+      секунд ждать свободного места;
+    - учёт времени установки соединения в Server-Timing и метриках.
+    """
+
+    health_check_pending = False
+    holds_slot = False
+
+    def get_new_connection(self, conn_params):
+        slots = get_slots(
+            self.alias, self.settings_dict.get('MAX_CONNECTIONS')
+        )
+        wait = self.settings_dict.get('CONNECTION_WAIT', 5)
+        if slots is not None and not slots.acquire(timeout=wait):
+            raise self.Database.OperationalError(
+                f'Нет свободных соединений с БД "{self.alias}" '
+                f'за {wait} с.'
+            )
+        started = time.perf_counter()
+        try:
+            connection = super().get_new_connection(conn_params)
+        except Exception:
+            if slots is not None:
+                slots.release()
+            raise
+        self.holds_slot = slots is not None
+        stats = current_stats()
+        if stats is not None:
+            stats.connections += 1
+            stats.connect_time += time.perf_counter() - started
+        return connection
+
+    def _close(self):
+        try:
+            return super()._close()
+        finally:
+            if self.holds_slot:
+                self.holds_slot = False
+                _slots[self.alias].release()
+
+    def close_if_unusable_or_obsolete(self):
+        super().close_if_unusable_or_obsolete()
+        self.health_check_pending = bool(
+            self.connection is not None
+            and self.settings_dict.get('CONN_HEALTH_CHECKS')
+        )
+
+    def ensure_connection(self):
+        if self.health_check_pending:
+            self.health_check_pending = False
+            if not self.in_atomic_block and not self.is_usable():
+                self.close()
+        super().ensure_connection()
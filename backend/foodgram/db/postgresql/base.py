@@ -0,0 +1,7 @@
+from django.db.backends.postgresql import base
+
+from ..connections import ManagedConnectionMixin
+
+
+class DatabaseWrapper(ManagedConnectionMixin, base.DatabaseWrapper):
+    pass
@@ -0,0 +1,162 @@
+import os
+import threading
+import uuid
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+
+TOPICS = ('recipes', 'tags', 'ingredients', 'follows', 'auth')
+# Бэкенды кэша Django, которые не видны другим процессам.
+LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+class CacheStore:
+    """Версии в общем кэше Django (memcached, redis)."""
+
+    shared_cache = True
+
+    @staticmethod
+    def key(topic):
+        return f'invalidation:{topic}'
+
+    def get_many(self, topics):
+        versions = cache.get_many([self.key(topic) for topic in topics])
+        return {topic: versions.get(self.key(topic)) for topic in topics}
+
+    def bump(self, topic):
+        version = uuid.uuid4().hex
+        cache.set(self.key(topic), version, None)
+        return version
+
+
+class FileStore:
+    """
+    Версии в файлах каталога, общего для воркеров одной машины.
+
+    Новая версия пишется во временный файл и атомарно подменяет
+    старую через os.replace, поэтому блокировки не нужны.
+    """
+
+    shared_cache = False
+
+    def __init__(self, path):
+        self.path = path
+
+    def get_many(self, topics):
+        versions = {}
+        for topic in topics:
+            try:
+                with open(os.path.join(self.path, topic)) as file:
+                    versions[topic] = file.read()
+            except FileNotFoundError:
+                versions[topic] = None
+        return versions
+
+    def bump(self, topic):
+        os.makedirs(self.path, exist_ok=True)
+        version = uuid.uuid4().hex
+        path = os.path.join(self.path, topic)
+        temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'w') as file:
+            file.write(version)
+        os.replace(temp_path, path)
+        return version
+
+
+def make_store():
+    store = settings.INVALIDATION_STORE
+    if not store:
+        backend = settings.CACHES['default']['BACKEND']
+        store = 'file' if backend in LOCAL_CACHES else 'cache'
+    if store == 'file':
+        return FileStore(settings.INVALIDATION_DIR)
+    return CacheStore()
+
+
+class InvalidationBus:
+    """
+    Шина инвалидации кэшей в памяти воркеров.
+
+    Сигналы моделей после коммита вызывают bump(topic): новая версия
+    темы пишется в общее хранилище. Каждый воркер в начале запроса
+    вызывает check() — одно чтение версий всех тем — и для
+    изменившихся тем запускает подписчиков, сбрасывающих его кэши.
+    Кэши, ключ которых строится из version(topic), устаревают сами.
+    """
+
+    def __init__(self, store=None):
+        self._store = store
+        self.lock = threading.Lock()
+        self.versions = {}
+        self.subscribers = defaultdict(list)
+
+    @property
+    def store(self):
+        if self._store is None:
+            self._store = make_store()
+        return self._store
+
+    def subscribe(self, topic, callback):
+        self.subscribers[topic].append(callback)
+
+    def notify(self, topics):
+        for topic in topics:
+            for callback in self.subscribers[topic]:
+                callback()
+
+    def check(self):
+        """Сверяет версии с хранилищем и сбрасывает устаревшие кэши."""
+        versions = self.store.get_many(TOPICS)
+        with self.lock:
+            changed = [
+                topic for topic in TOPICS
+                if topic in self.versions
+                and self.versions[topic] != versions[topic]
+            ]
+            self.versions = versions
+        self.notify(changed)
+
+    def version(self, topic):
+        """Версия темы на момент последней проверки."""
+        if not self.versions:
+            self.check()
+        return self.versions.get(topic) or ''
+
+    def bump(self, topic):
+        if not self.versions:
+            self.check()
+        version = self.store.bump(topic)
+        with self.lock:
+            self.versions = dict(self.versions, **{topic: version})
+        self.notify([topic])
+
+    def key_version(self, topic, key):
+        """
+        Версия одного ключа темы, например списка одного пользователя.
+
+        В отличие от тем, читается из хранилища при каждом вызове и
+        подписчиков не запускает.
+        """
+        name = f'{topic}.{key}'
+        return self.store.get_many([name])[name] or ''
+
+    def bump_key(self, topic, key):
+        return self.store.bump(f'{topic}.{key}')
+
+
+bus = InvalidationBus()
+
+
+class InvalidationMiddleware:
+    """Перед каждым запросом сверяет версии шины инвалидации."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        bus.check()
+        return self.get_response(request)
@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 from dotenv import load_dotenv
 
@@ -25,6 +26,10 @@ INSTALLED_APPS = [
     'api'
 ]
 MIDDLEWARE = [
+    'api.middleware.ServerTimingMiddleware',
+    'foodgram.invalidation.InvalidationMiddleware',
+    'api.nplusone.NPlusOneMiddleware',
+    'api.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -59,18 +64,61 @@ WSGI_APPLICATION = 'foodgram.wsgi.application'
 #     }
 # }
 
+# Стандартные бэкенды подменяются обёртками из foodgram.db: они
+# проверяют постоянные соединения, ограничивают их число на воркер
+# и замеряют время подключения.
+DB_BACKENDS = {
+    'django.db.backends.postgresql': 'foodgram.db.postgresql',
+    'django.db.backends.sqlite3': 'foodgram.db.sqlite3',
+}
+
 # Database postgresql
 DATABASES = {
     'default': {
-        'ENGINE': os.getenv('DB_ENGINE'),
+        'ENGINE': DB_BACKENDS.get(
+            os.getenv('DB_ENGINE'), os.getenv('DB_ENGINE')
+        ),
         'NAME': os.getenv('DB_NAME'),
         'USER': os.getenv('POSTGRES_USER'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
         'HOST': os.getenv('DB_HOST'),
-        'PORT': os.getenv('DB_PORT')
+        'PORT': os.getenv('DB_PORT'),
+        # Сколько секунд держать соединение между запросами
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+        # Проверять соединение перед повторным использованием
+        'CONN_HEALTH_CHECKS': True,
+        # Соединений на воркер (0 — без ограничения) и ожидание места
+        'MAX_CONNECTIONS': int(os.getenv('DB_MAX_CONNECTIONS', 0)),
+        'CONNECTION_WAIT': 5,
     }
 }
 
+# Реплики только для чтения: через запятую хосты PostgreSQL
+# или, для локальной проверки на SQLite, пути к файлам БД.
+DATABASE_REPLICAS = []
+for number, replica in enumerate(
+    filter(None, os.getenv('DB_REPLICAS', '').split(',')), start=1
+):
+    alias = f'replica_{number}'
+    DATABASES[alias] = dict(
+        DATABASES['default'],
+        TEST={'MIRROR': 'default'},
+        **(
+            {'NAME': replica}
+            if 'sqlite' in (DATABASES['default']['ENGINE'] or '')
+            else {'HOST': replica}
+        )
+    )
+    DATABASE_REPLICAS.append(alias)
+DATABASE_ROUTERS = ['api.db_router.ReplicaRouter']
+# Сколько секунд после записи пользователь читает только с primary
+REPLICA_PIN_SECONDS = 5
+# Где хранятся отметки о записи, если кэш Django свой у каждого воркера
+REPLICA_PIN_DIR = os.getenv(
+    'REPLICA_PIN_DIR',
+    os.path.join(tempfile.gettempdir(), 'foodgram_replica_pins')
+)
+
 # Users model
 AUTH_USER_MODEL = 'users.User'
 # Password validation
@@ -102,10 +150,60 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Файлы называются по хэшу содержимого и не дублируются
+DEFAULT_FILE_STORAGE = 'recipes.storage.ContentAddressedStorage'
 
 DATA_FILES_DIR = os.path.join(BASE_DIR, 'data')
 FONTS_FILES_DIR = os.path.join(DATA_FILES_DIR, 'HelveticaRegular.ttf')
 
+# Ограничения для картинок, присланных в base64
+BASE64_IMAGE_MAX_SIZE = int(
+    os.getenv('BASE64_IMAGE_MAX_SIZE', 10 * 1024 * 1024)
+)
+BASE64_IMAGE_MAX_DIMENSION = int(
+    os.getenv('BASE64_IMAGE_MAX_DIMENSION', 4096)
+)
+
+# Уменьшенные копии картинок рецептов: размер -> наибольшая сторона
+RECIPE_IMAGE_VARIANTS = {
+    'thumbnail': 300,
+    'card': 600,
+    'full': 1280,
+}
+RECIPE_IMAGE_FORMATS = ('webp', 'jpeg')
+RECIPE_IMAGE_QUALITY = 82
+RECIPE_IMAGE_WORKERS = int(os.getenv('RECIPE_IMAGE_WORKERS', 2))
+RECIPE_IMAGE_VARIANTS_ASYNC = True
+# Сколько секунд картинка, загруженная отдельным запросом, ждёт рецепта;
+# просроченные загрузки удаляет collect_media
+IMAGE_UPLOAD_TTL = int(os.getenv('IMAGE_UPLOAD_TTL', 24 * 60 * 60))
+
+# Замеры времени запросов: заголовок Server-Timing и /api/metrics/.
+# Воркеры gunicorn складывают гистограммы в общий каталог METRICS_DIR.
+SERVER_TIMING_HEADER = True
+METRICS_DIR = os.getenv(
+    'METRICS_DIR', os.path.join(tempfile.gettempdir(), 'foodgram_metrics')
+)
+METRICS_FLUSH_INTERVAL = 5
+# Bearer-токен для /api/metrics/; без него метрики видят только сотрудники
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Поиск N+1 запросов: off, log или raise. На стенде включается через
+# окружение, в tests/tests.py — в режиме raise для всех запросов API.
+NPLUSONE_DETECTION = os.getenv('NPLUSONE_DETECTION', 'off')
+NPLUSONE_THRESHOLD = int(os.getenv('NPLUSONE_THRESHOLD', 5))
+
+# Профилирование живых запросов: доля запросов и/или заголовок X-Profile.
+# Режим cprofile пишет дампы pstats, sampler — свёрнутые стеки.
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', 0))
+PROFILING_TOKEN = os.getenv('PROFILING_TOKEN', '')
+PROFILING_MODE = os.getenv('PROFILING_MODE', 'cprofile')
+PROFILING_DIR = os.getenv(
+    'PROFILING_DIR', os.path.join(tempfile.gettempdir(), 'foodgram_profiles')
+)
+PROFILING_MAX_FILES = 50
+PROFILING_SAMPLER_INTERVAL = 0.005
+
 # E-mail settings
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 # REST FRAMEWORK settings
@@ -115,12 +213,81 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
+    ],
+
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+
+    'DEFAULT_PARSER_CLASSES': [
+        'api.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ],
     'PAGE_SIZE': 6,
 
 }
 
+# Список рецептов и подписки собираются из проекций .values()
+# вместо RecipeSerializer и SubscriptionShowSerializer
+PROJECTION_READS = True
+
+# Сколько секунд /api/bootstrap/ держит теги в кэше
+BOOTSTRAP_CACHE_TTL = 300
+
+# Сколько секунд кэш хранит id рецептов в избранном и списке покупок
+# пользователя
+VIEWER_IDS_TTL = 24 * 60 * 60
+# Сколько массивов, не влезших в слот SharedMemoryCache, воркер держит у себя
+VIEWER_IDS_LOCAL_SIZE = 256
+
+# Сколько похожих рецептов хранится и отдаётся на рецепт
+SIMILAR_RECIPES_COUNT = 10
+# Сколько значений сходства считается за одно произведение матриц:
+# ограничивает память build_similar_recipes на большом каталоге
+SIMILAR_MAX_SCORES = int(os.getenv('SIMILAR_MAX_SCORES', 2_000_000))
+
+# Сколько подзапросов можно передать в /api/batch/
+BATCH_MAX_REQUESTS = 20
+# Роутеры API, доступные подзапросам /api/batch/ (префикс имени URL)
+BATCH_ALLOWED_ROUTES = ('users', 'ingredients', 'recipes', 'tags')
+
+# Сколько секунд nginx и браузеры могут хранить ответы анонимам
+PUBLIC_CACHE_MAX_AGE = int(os.getenv('PUBLIC_CACHE_MAX_AGE', 10))
+# Префикс для обновления микрокэша nginx, например http://nginx/_purge
+NGINX_PURGE_URL = os.getenv('NGINX_PURGE_URL', '')
+NGINX_PURGE_HOSTS = [
+    host for host in ALLOWED_HOSTS if host not in ('localhost', '127.0.0.1')
+]
+
+# Общий кэш воркеров в разделяемой памяти, без redis и memcached.
+# CACHE_LOCATION — файл, лучше в /dev/shm; без него у каждого процесса
+# свой LocMemCache.
+if os.getenv('CACHE_LOCATION'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'foodgram.shared_cache.SharedMemoryCache',
+            'LOCATION': os.getenv('CACHE_LOCATION'),
+            'OPTIONS': {'MAX_ENTRIES': 4096, 'SLOT_SIZE': 8192},
+        }
+    }
+
+# Где шина инвалидации хранит версии кэшей воркеров: cache (общий кэш
+# Django) или file (каталог INVALIDATION_DIR, общий для воркеров машины).
+# По умолчанию file, если кэш Django локальный для процесса.
+INVALIDATION_STORE = os.getenv('INVALIDATION_STORE', '')
+INVALIDATION_DIR = os.getenv(
+    'INVALIDATION_DIR',
+    os.path.join(tempfile.gettempdir(), 'foodgram_invalidation')
+)
+
+# Кэш пары (пользователь, токен) для CachedTokenAuthentication
+TOKEN_CACHE_TTL = 300
+TOKEN_CACHE_LOCAL_TTL = 10
+TOKEN_CACHE_LOCAL_SIZE = 1024
+
 DJOSER = {
     'HIDE_USERS': False,
     'LOGIN_FIELD': 'email',
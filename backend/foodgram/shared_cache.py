@@ -0,0 +1,302 @@
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import pickle
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+MAGIC = b'FGC2'
+# Сигнатура и геометрия таблицы: число корзин, слотов в корзине, размер слота.
+HEADER = struct.Struct('<4sIII')
+HEADER_SIZE = 64
+# Заголовок слота: хэш ключа, срок жизни, время обращения, длина данных.
+SLOT = struct.Struct('<QdQI')
+KEY_LENGTH = struct.Struct('<H')
+
+logger = logging.getLogger(__name__)
+
+segments = {}
+segments_lock = threading.Lock()
+
+
+def key_hash(key):
+    """Ненулевой 64-битный хэш: нулевой означает пустой слот."""
+    digest = hashlib.blake2b(key, digest_size=8).digest()
+    return int.from_bytes(digest, 'little') | 1
+
+
+class Segment:
+    """
+    Файл, отображённый в память, с хэш-таблицей записей кэша.
+
+    Таблица состоит из buckets корзин по ways слотов фиксированного
+    размера slot_size. Ключ попадает в корзину по хэшу; когда в ней
+    нет свободного слота, вытесняется запись, к которой дольше всего
+    не обращались (LRU внутри корзины). Все операции выполняются под
+    flock на файл, поэтому атомарны между процессами, и под
+    блокировкой потока, потому что дескриптор в процессе общий.
+    """
+
+    def __init__(self, path, buckets, ways, slot_size):
+        self.buckets = buckets
+        self.ways = ways
+        self.slot_size = slot_size
+        # Сколько значений в этом процессе не влезло в слот.
+        self.oversize = 0
+        self.thread_lock = threading.Lock()
+        header = HEADER.pack(MAGIC, buckets, ways, slot_size)
+        size = HEADER_SIZE + buckets * ways * slot_size
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            if (
+                os.fstat(self.fd).st_size != size
+                or os.pread(self.fd, HEADER.size, 0) != header
+            ):
+                # Новый файл или другая геометрия: размечаем заново.
+                os.ftruncate(self.fd, 0)
+                os.ftruncate(self.fd, size)
+                os.pwrite(self.fd, header, 0)
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        self.memory = mmap.mmap(self.fd, size)
+
+    @contextmanager
+    def locked(self):
+        with self.thread_lock:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def slots(self, hashed):
+        # Младший бит хэша всегда 1, корзину выбирают остальные биты.
+        start = HEADER_SIZE + (
+            (hashed >> 1) % self.buckets * self.ways * self.slot_size
+        )
+        return range(start, start + self.ways * self.slot_size, self.slot_size)
+
+    def fits(self, key, value):
+        return (
+            SLOT.size + KEY_LENGTH.size + len(key) + len(value)
+            <= self.slot_size
+        )
+
+    def key_at(self, offset):
+        start = offset + SLOT.size
+        (length,) = KEY_LENGTH.unpack_from(self.memory, start)
+        start += KEY_LENGTH.size
+        return self.memory[start:start + length]
+
+    def value_at(self, offset):
+        length = SLOT.unpack_from(self.memory, offset)[3]
+        start = offset + SLOT.size
+        (key_length,) = KEY_LENGTH.unpack_from(self.memory, start)
+        start += KEY_LENGTH.size + key_length
+        return self.memory[start:offset + SLOT.size + length]
+
+    def expires_at(self, offset):
+        return SLOT.unpack_from(self.memory, offset)[1]
+
+    def find(self, key, hashed, now):
+        """Смещение живой записи key или None; просроченную освобождает."""
+        for offset in self.slots(hashed):
+            slot_hash, expires, _, length = SLOT.unpack_from(
+                self.memory, offset
+            )
+            if slot_hash != hashed or not length:
+                continue
+            if self.key_at(offset) != key:
+                continue
+            if expires and expires <= now:
+                self.free(offset)
+                return None
+            return offset
+        return None
+
+    def victim(self, hashed, now):
+        """Свободный или просроченный слот корзины, иначе самый старый."""
+        oldest = oldest_used = None
+        for offset in self.slots(hashed):
+            _, expires, used, length = SLOT.unpack_from(self.memory, offset)
+            if not length or (expires and expires <= now):
+                return offset
+            if oldest is None or used < oldest_used:
+                oldest, oldest_used = offset, used
+        return oldest
+
+    def store(self, offset, key, hashed, value, expires):
+        data = KEY_LENGTH.pack(len(key)) + key + value
+        SLOT.pack_into(
+            self.memory, offset, hashed, expires or 0.0, time.time_ns(),
+            len(data)
+        )
+        start = offset + SLOT.size
+        self.memory[start:start + len(data)] = data
+
+    def mark_used(self, offset):
+        slot_hash, expires, _, length = SLOT.unpack_from(self.memory, offset)
+        SLOT.pack_into(
+            self.memory, offset, slot_hash, expires, time.time_ns(), length
+        )
+
+    def set_expires(self, offset, expires):
+        slot_hash, _, used, length = SLOT.unpack_from(self.memory, offset)
+        SLOT.pack_into(
+            self.memory, offset, slot_hash, expires or 0.0, used, length
+        )
+
+    def free(self, offset):
+        SLOT.pack_into(self.memory, offset, 0, 0.0, 0, 0)
+
+    def clear(self):
+        for offset in range(
+            HEADER_SIZE, len(self.memory), self.slot_size
+        ):
+            self.free(offset)
+
+
+def get_segment(path, buckets, ways, slot_size):
+    """
+    Один Segment на файл в процессе: кэши Django создаются на поток.
+
+    После fork воркер открывает файл заново: flock на унаследованном
+    дескрипторе не исключал бы одновременный доступ родителя и детей.
+    """
+    key = (path, os.getpid())
+    with segments_lock:
+        if key not in segments:
+            segments[key] = Segment(path, buckets, ways, slot_size)
+        return segments[key]
+
+
+class SharedMemoryCache(BaseCache):
+    """
+    Кэш Django в разделяемой памяти, общий для воркеров одной машины.
+
+    LOCATION — путь к файлу, лучше в /dev/shm. Объём ограничен
+    MAX_ENTRIES записями по SLOT_SIZE байт. Значения крупнее слота
+    не кэшируются: set и add возвращают False, а отказ пишется в лог
+    и считается в Segment.oversize. add и incr атомарны между
+    процессами.
+
+        CACHES = {'default': {
+            'BACKEND': 'foodgram.shared_cache.SharedMemoryCache',
+            'LOCATION': '/dev/shm/foodgram-cache',
+            'OPTIONS': {'MAX_ENTRIES': 4096, 'SLOT_SIZE': 8192},
+        }}
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        ways = options.get('WAYS', 8)
+        self.geometry = (
+            location,
+            max(1, self._max_entries // ways),
+            ways,
+            options.get('SLOT_SIZE', 4096),
+        )
+
+    @property
+    def segment(self):
+        return get_segment(*self.geometry)
+
+    def encode_key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        key = key.encode()
+        return key, key_hash(key)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.store(key, value, timeout, version, only_new=True)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.store(key, value, timeout, version)
+
+    def store(self, key, value, timeout, version, only_new=False):
+        key, hashed = self.encode_key(key, version)
+        value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        expires = self.get_backend_timeout(timeout)
+        segment = self.segment
+        with segment.locked():
+            offset = segment.find(key, hashed, time.time())
+            if offset is not None and only_new:
+                return False
+            if not segment.fits(key, value):
+                if offset is not None:
+                    segment.free(offset)
+                segment.oversize += 1
+                logger.warning(
+                    'Значение %s (%d байт) не помещается в слот %d байт',
+                    key.decode(), len(value), segment.slot_size
+                )
+                return False
+            if offset is None:
+                offset = segment.victim(hashed, time.time())
+            segment.store(offset, key, hashed, value, expires)
+        return True
+
+    def get(self, key, default=None, version=None):
+        key, hashed = self.encode_key(key, version)
+        segment = self.segment
+        with segment.locked():
+            offset = segment.find(key, hashed, time.time())
+            if offset is None:
+                return default
+            segment.mark_used(offset)
+            value = segment.value_at(offset)
+        return pickle.loads(value)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key, hashed = self.encode_key(key, version)
+        segment = self.segment
+        with segment.locked():
+            offset = segment.find(key, hashed, time.time())
+            if offset is None:
+                return False
+            segment.set_expires(
+                offset, self.get_backend_timeout(timeout)
+            )
+        return True
+
+    def incr(self, key, delta=1, version=None):
+        encoded, hashed = self.encode_key(key, version)
+        segment = self.segment
+        with segment.locked():
+            offset = segment.find(encoded, hashed, time.time())
+            if offset is None:
+                raise ValueError("Key '%s' not found" % key)
+            value = pickle.loads(segment.value_at(offset)) + delta
+            segment.store(
+                offset, encoded, hashed,
+                pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                segment.expires_at(offset),
+            )
+        return value
+
+    def has_key(self, key, version=None):
+        key, hashed = self.encode_key(key, version)
+        segment = self.segment
+        with segment.locked():
+            return segment.find(key, hashed, time.time()) is not None
+
+    def delete(self, key, version=None):
+        key, hashed = self.encode_key(key, version)
+        segment = self.segment
+        with segment.locked():
+            offset = segment.find(key, hashed, time.time())
+            if offset is not None:
+                segment.free(offset)
+
+    def clear(self):
+        segment = self.segment
+        with segment.locked():
+            segment.clear()
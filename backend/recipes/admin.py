@@ -2,12 +2,15 @@ from django.contrib import admin
 
 from .models import (
     Favorite,
+    ImageUpload,
     Ingredient,
     IngredientRecipe,
     Recipe,
     ShoppingCart,
+    SimilarRecipe,
     Tag
 )
+from .snapshots import refresh_snapshot
 
 
 @admin.register(Ingredient)
@@ -56,6 +59,11 @@ class RecipeAdmin(admin.ModelAdmin):
         IngredientRecipeInline,
     ]
 
+    def save_related(self, request, form, formsets, change):
+        """После сохранения ингредиентов обновляет их копию в рецепте."""
+        super().save_related(request, form, formsets, change)
+        refresh_snapshot(form.instance)
+
     def favorite_count(self, obj):
         """Выводит общее число добавлений этого рецепта в избранное."""
         return obj.favorit_recipe.count()
@@ -87,4 +95,32 @@ class ShoppingCartAdmin(admin.ModelAdmin):
     search_fields = ('user', 'recipe', )
 
 
+@admin.register(ImageUpload)
+class ImageUploadAdmin(admin.ModelAdmin):
+    """Класс админ-панели, отвечающий за загруженные картинки."""
+
+    list_display = (
+        'pk',
+        'user',
+        'image',
+        'created',
+    )
+    list_filter = ('user', )
+    search_fields = ('user', )
+
+
+@admin.register(SimilarRecipe)
+class SimilarRecipeAdmin(admin.ModelAdmin):
+    """Класс админ-панели, отвечающий за похожие рецепты."""
+
+    list_display = (
+        'pk',
+        'recipe',
+        'similar',
+        'score',
+    )
+    raw_id_fields = ('recipe', 'similar')
+    search_fields = ('recipe__name', )
+
+
 admin.sites.AdminSite.empty_value_display = '-пусто-'
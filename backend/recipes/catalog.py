@@ -0,0 +1,15 @@
+from foodgram.invalidation import bus
+
+
+def catalog_version():
+    """
+    Текущая версия каталога ингредиентов.
+
+    Меняется при каждом изменении ингредиентов; по ней воркеры
+    понимают, что их копия каталога в памяти устарела.
+    """
+    return bus.version('ingredients')
+
+
+def bump_catalog_version():
+    bus.bump('ingredients')
@@ -0,0 +1,151 @@
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from PIL import Image, features
+
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+PILLOW_FORMATS = {'jpeg': 'JPEG', 'webp': 'WEBP'}
+
+_executor = None
+
+
+def get_executor():
+    """Пул потоков для фоновой нарезки картинок, создаётся лениво."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.RECIPE_IMAGE_WORKERS,
+            thread_name_prefix='recipe-images',
+        )
+    return _executor
+
+
+def get_formats():
+    """Форматы из настроек, которые поддерживает установленный Pillow."""
+    return [
+        image_format for image_format in settings.RECIPE_IMAGE_FORMATS
+        if image_format != 'webp' or features.check('webp')
+    ]
+
+
+def variant_name(name, size, image_format):
+    """
+    Имя файла уменьшенной копии.
+
+    Копии лежат рядом с оригиналом:
+    recipes/images/temp.png -> recipes/images/temp_card.webp.
+    """
+    root, _ = os.path.splitext(name)
+    return f'{root}_{size}.{image_format}'
+
+
+def has_variants(name, storage=default_storage):
+    """Проверяет, что копии уже нарезаны: последняя из них на месте."""
+    size = list(settings.RECIPE_IMAGE_VARIANTS)[-1]
+    return storage.exists(variant_name(name, size, get_formats()[-1]))
+
+
+def mark_variants(name):
+    """Отмечает у рецептов с картинкой name, что её копии готовы."""
+    Recipe.objects.filter(image=name).exclude(
+        image_variants=name
+    ).update(image_variants=name)
+
+
+def make_variants(name, storage=default_storage, force=False):
+    """
+    Нарезает уменьшенные копии картинки во всех размерах и форматах
+    и отмечает их готовность у рецептов.
+    """
+    if not name:
+        return
+    if force or not has_variants(name, storage):
+        cut_variants(name, storage)
+    mark_variants(name)
+
+
+def cut_variants(name, storage):
+    with storage.open(name) as file:
+        original = Image.open(file)
+        original.load()
+    if original.mode not in ('RGB', 'RGBA'):
+        original = original.convert('RGBA')
+    for size, max_side in settings.RECIPE_IMAGE_VARIANTS.items():
+        image = original.copy()
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+        for image_format in get_formats():
+            buffer = io.BytesIO()
+            converted = image
+            if image_format == 'jpeg' and image.mode != 'RGB':
+                converted = image.convert('RGB')
+            converted.save(
+                buffer,
+                format=PILLOW_FORMATS[image_format],
+                quality=settings.RECIPE_IMAGE_QUALITY,
+                optimize=True,
+            )
+            target = variant_name(name, size, image_format)
+            if storage.exists(target):
+                storage.delete(target)
+            storage.save(target, ContentFile(buffer.getvalue()))
+
+
+def schedule_variants(name):
+    """Ставит нарезку копий в фоновый пул потоков."""
+    if not settings.RECIPE_IMAGE_VARIANTS_ASYNC:
+        return make_variants(name)
+    future = get_executor().submit(make_variants_in_background, name)
+    future.add_done_callback(_log_failure)
+    return future
+
+
+def make_variants_in_background(name):
+    try:
+        make_variants(name)
+    finally:
+        # Поток пула живёт долго: соединение с БД между задачами не держим.
+        connection.close()
+
+
+def _log_failure(future):
+    exception = future.exception()
+    if exception is not None:
+        logger.error(
+            'Не удалось нарезать копии картинки',
+            exc_info=exception
+        )
+
+
+def variant_urls(name, ready, storage=default_storage):
+    """
+    Словарь {размер: {формат: url}}.
+
+    ready — копии нарезаны (Recipe.image_variants равно name); пока
+    нет, во всех размерах отдаётся оригинал. Наличие файлов здесь не
+    проверяется: функция вызывается для каждой строки списков.
+    """
+    formats = get_formats()
+    if not ready:
+        url = storage.url(name)
+        return {
+            size: {image_format: url for image_format in formats}
+            for size in settings.RECIPE_IMAGE_VARIANTS
+        }
+    return {
+        size: {
+            image_format: storage.url(
+                variant_name(name, size, image_format)
+            )
+            for image_format in formats
+        }
+        for size in settings.RECIPE_IMAGE_VARIANTS
+    }
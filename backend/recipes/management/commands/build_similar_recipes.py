@@ -0,0 +1,46 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipes.similarity import (
+    IngredientMatrix,
+    add_recipes,
+    pending_recipe_ids,
+    rebuild
+)
+
+
+class Command(BaseCommand):
+    """Считает похожие рецепты по общим ингредиентам."""
+
+    help = (
+        'Пересчитывает таблицу похожих рецептов; с --incremental '
+        'только для рецептов, у которых соседей ещё нет'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help='Добавить только новые рецепты',
+        )
+        parser.add_argument(
+            '--top-k', type=int, default=settings.SIMILAR_RECIPES_COUNT
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        matrix = IngredientMatrix()
+        if options['incremental']:
+            count = add_recipes(
+                matrix, pending_recipe_ids(),
+                options['top_k'], options['batch_size']
+            )
+        else:
+            count = rebuild(matrix, options['top_k'], options['batch_size'])
+        self.stdout.write(
+            f'Соседи посчитаны для {count} рецептов '
+            f'за {time.monotonic() - started:.1f} с'
+        )
@@ -0,0 +1,47 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import Recipe
+from recipes.snapshots import collect_ingredients, refresh_snapshots
+from recipes.utils import iter_batches
+
+
+class Command(BaseCommand):
+    """Сверяет копии ингредиентов в рецептах с таблицей IngredientRecipe."""
+
+    help = 'Проверяет Recipe.ingredients_snapshot и при --fix исправляет'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix',
+            action='store_true',
+            help='Переписать устаревшие копии',
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def stale_ids(self, batch_size):
+        recipe_ids = Recipe.objects.order_by('id').values_list(
+            'id', flat=True
+        )
+        for batch in iter_batches(recipe_ids.iterator(), batch_size):
+            stored = dict(
+                Recipe.objects.filter(id__in=batch)
+                .values_list('id', 'ingredients_snapshot')
+            )
+            for recipe_id, snapshot in collect_ingredients(batch).items():
+                if json.loads(stored[recipe_id]) != json.loads(snapshot):
+                    yield recipe_id
+
+    def handle(self, *args, **options):
+        stale = list(self.stale_ids(options['batch_size']))
+        if not stale:
+            self.stdout.write('Копии ингредиентов актуальны')
+            return
+        if not options['fix']:
+            raise CommandError(
+                f'Копии ингредиентов устарели у {len(stale)} рецептов, '
+                f'например {stale[:10]}. Исправить: --fix.'
+            )
+        refresh_snapshots(stale, options['batch_size'])
+        self.stdout.write(f'Исправлено рецептов: {len(stale)}')
@@ -0,0 +1,91 @@
+import os
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from recipes.images import variant_name
+from recipes.models import ImageUpload, Recipe
+
+IMAGES_DIR = 'recipes/images'
+
+
+class Command(BaseCommand):
+    """
+    Удаляет картинки рецептов, на которые не осталось ссылок.
+
+    Загрузки, не привязанные к рецепту за IMAGE_UPLOAD_TTL, удаляются
+    вместе с записью и ссылками не считаются.
+    """
+
+    help = 'Удаляет картинки рецептов, на которые не осталось ссылок'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать, что будет удалено',
+        )
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=3600,
+            help='Не трогать файлы моложе указанного числа секунд',
+        )
+
+    def get_references(self, expires_before):
+        """Считает ссылки из базы на каждый файл и его копии."""
+        references = Counter(
+            Recipe.objects.values_list('image', flat=True)
+        )
+        references.update(
+            ImageUpload.objects.filter(
+                created__gte=expires_before
+            ).values_list('image', flat=True)
+        )
+        for name, count in list(references.items()):
+            for size in settings.RECIPE_IMAGE_VARIANTS:
+                for image_format in settings.RECIPE_IMAGE_FORMATS:
+                    references[
+                        variant_name(name, size, image_format)
+                    ] += count
+        return references
+
+    def walk(self, directory):
+        """Обходит все файлы в каталоге хранилища."""
+        if not default_storage.exists(directory):
+            return
+        directories, files = default_storage.listdir(directory)
+        for file in files:
+            yield os.path.join(directory, file)
+        for subdirectory in directories:
+            yield from self.walk(os.path.join(directory, subdirectory))
+
+    def handle(self, *args, **options):
+        expires_before = ImageUpload.expires_before()
+        expired = ImageUpload.objects.filter(created__lt=expires_before)
+        if options['dry_run']:
+            self.stdout.write(f'Просроченных загрузок: {expired.count()}')
+        else:
+            deleted, _ = expired.delete()
+            self.stdout.write(f'Удалено просроченных загрузок: {deleted}')
+        references = self.get_references(expires_before)
+        deadline = time.time() - options['min_age']
+        removed = freed = 0
+        for name in self.walk(IMAGES_DIR):
+            if references[name]:
+                continue
+            path = default_storage.path(name)
+            if os.path.getmtime(path) > deadline:
+                continue
+            removed += 1
+            freed += os.path.getsize(path)
+            if options['dry_run']:
+                self.stdout.write(name)
+            else:
+                default_storage.delete(name)
+        self.stdout.write(
+            f'Файлов без ссылок: {removed}, освобождено байт: {freed}'
+        )
@@ -0,0 +1,267 @@
+import io
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    IngredientRecipe,
+    Recipe,
+    ShoppingCart,
+    Tag
+)
+from recipes.snapshots import refresh_snapshots
+from recipes.utils import PowerLawPicker, iter_batches
+from users.models import Follow, User
+
+TAG_COLORS = (
+    '#ff0000', '#008000', '#0000ff', '#ffa500', '#800080',
+    '#ffc0cb', '#a52a2a', '#808080', '#ffff00', '#00ffff',
+)
+# Сколько повторов подряд терпеть, прежде чем признать, что новых
+# пар из степенного распределения уже не набрать.
+MAX_REPEATS = 10000
+
+
+class Command(BaseCommand):
+    """
+    Генератор синтетических данных для нагрузочного тестирования.
+
+    При одном и том же --seed и пустой базе данные получаются одинаковыми.
+    Популярность авторов и рецептов распределена по степенному закону:
+    немногие авторы собирают большую часть подписчиков и избранного.
+    Подписок, избранного и корзин создаётся столько, сколько запрошено,
+    если хватает различных пар.
+    Ингредиенты берутся из уже загруженного каталога (load_data).
+    """
+
+    help = 'Генерирует пользователей, подписки, рецепты, избранное и корзины'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--follows', type=int, default=20000)
+        parser.add_argument('--tags', type=int, default=len(TAG_COLORS))
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--favorites', type=int, default=100000)
+        parser.add_argument('--carts', type=int, default=20000)
+        parser.add_argument(
+            '--ingredients-per-recipe',
+            type=int,
+            default=7,
+            help='Среднее число ингредиентов в рецепте',
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--prefix',
+            default='synthetic',
+            help='Префикс имён пользователей и тегов',
+        )
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.prefix = options['prefix']
+        ingredient_ids = list(
+            Ingredient.objects.values_list('id', flat=True)
+        )
+        if not ingredient_ids:
+            raise CommandError(
+                'Каталог ингредиентов пуст, сначала выполните load_data.'
+            )
+        if options['users'] < 1:
+            raise CommandError('Нужен хотя бы один пользователь.')
+        if User.objects.filter(username__startswith=self.prefix).exists():
+            raise CommandError(
+                f'Пользователи с префиксом {self.prefix} уже есть, '
+                'укажите другой --prefix.'
+            )
+
+        user_ids = self.create_users(options['users'])
+        tag_ids = self.create_tags(options['tags'])
+        self.create_follows(user_ids, options['follows'])
+        recipe_ids = self.create_recipes(
+            user_ids, tag_ids, ingredient_ids,
+            options['recipes'], options['ingredients_per_recipe']
+        )
+        self.create_pairs(
+            Favorite, user_ids, recipe_ids, options['favorites']
+        )
+        self.create_pairs(
+            ShoppingCart, user_ids, recipe_ids, options['carts']
+        )
+
+    def bulk_create(self, model, objects, **kwargs):
+        """Пишет объекты пачками и сообщает скорость записи."""
+        started = time.monotonic()
+        total = 0
+        for batch in iter_batches(objects, self.batch_size):
+            model.objects.bulk_create(batch, **kwargs)
+            total += len(batch)
+        elapsed = time.monotonic() - started or 1e-9
+        self.stdout.write(
+            f'{model._meta.verbose_name_plural}: {total} '
+            f'за {elapsed:.1f} с ({total / elapsed:.0f} строк/с)'
+        )
+
+    @staticmethod
+    def new_ids(model, last_id):
+        """id объектов, созданных после last_id, по порядку."""
+        return list(
+            model.objects.filter(id__gt=last_id)
+            .order_by('id').values_list('id', flat=True)
+        )
+
+    @staticmethod
+    def last_id(model):
+        return model.objects.order_by('-id').values_list(
+            'id', flat=True
+        ).first() or 0
+
+    def create_users(self, count):
+        last_id = self.last_id(User)
+        password = make_password('password')
+        self.bulk_create(User, (
+            User(
+                username=f'{self.prefix}{number}',
+                email=f'{self.prefix}{number}@example.com',
+                first_name=f'Имя{number}',
+                last_name=f'Фамилия{number}',
+                password=password,
+            )
+            for number in range(count)
+        ))
+        return self.new_ids(User, last_id)
+
+    def create_tags(self, count):
+        last_id = self.last_id(Tag)
+        self.bulk_create(Tag, (
+            Tag(
+                name=f'Тег {number}',
+                slug=f'{self.prefix}-{number}',
+                color=TAG_COLORS[number % len(TAG_COLORS)],
+            )
+            for number in range(count)
+        ))
+        return self.new_ids(Tag, last_id)
+
+    def unique_pairs(self, model, count, capacity, pick):
+        """
+        count различных пар (a, b) из pick().
+
+        Повторы и пары None отбрасываются и тянутся заново, поэтому
+        записей получается ровно count, если столько различных пар
+        вообще есть; иначе недобор сообщается в выводе. Пары хранятся
+        одним числом, чтобы миллион пар не занимал сотни мегабайт.
+        """
+        target = min(count, capacity)
+        seen = set()
+        repeats = 0
+        while len(seen) < target and repeats < MAX_REPEATS:
+            pair = pick()
+            key = None if pair is None else pair[0] << 32 | pair[1]
+            if key is None or key in seen:
+                repeats += 1
+                continue
+            repeats = 0
+            seen.add(key)
+            yield pair
+        if len(seen) < count:
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}: создано {len(seen)} '
+                f'из {count}, различных пар больше не нашлось'
+            )
+
+    def create_follows(self, user_ids, count):
+        """Подписки: на популярных авторов подписываются чаще."""
+        authors = user_ids[:]
+        self.rng.shuffle(authors)
+        popular = PowerLawPicker(authors, 1.1, self.rng)
+
+        def pick():
+            user = self.rng.choice(user_ids)
+            following = popular.pick()
+            return None if user == following else (user, following)
+
+        pairs = self.unique_pairs(
+            Follow, count, len(user_ids) * (len(user_ids) - 1), pick
+        )
+        self.bulk_create(Follow, (
+            Follow(user_id=user, following_id=following)
+            for user, following in pairs
+        ))
+
+    def placeholder_image(self):
+        """Одна общая картинка для всех сгенерированных рецептов."""
+        buffer = io.BytesIO()
+        Image.new('RGB', (600, 400), (200, 120, 60)).save(
+            buffer, format='JPEG'
+        )
+        return default_storage.save(
+            'recipes/images/synthetic.jpeg', ContentFile(buffer.getvalue())
+        )
+
+    def create_recipes(
+        self, user_ids, tag_ids, ingredient_ids, count, ingredients_mean
+    ):
+        last_id = self.last_id(Recipe)
+        image = self.placeholder_image()
+        authors = PowerLawPicker(user_ids, 0.8, self.rng)
+        self.bulk_create(Recipe, (
+            Recipe(
+                name=f'Рецепт {number}',
+                text='Смешать ингредиенты и готовить до готовности. ' * 3,
+                author_id=authors.pick(),
+                image=image,
+                cooking_time=self.rng.randint(5, 180),
+            )
+            for number in range(count)
+        ))
+        recipe_ids = self.new_ids(Recipe, last_id)
+
+        def recipe_tags():
+            for recipe_id in recipe_ids:
+                for tag_id in self.rng.sample(
+                    tag_ids, min(len(tag_ids), self.rng.randint(1, 3))
+                ):
+                    yield Recipe.tags.through(
+                        recipe_id=recipe_id, tag_id=tag_id
+                    )
+
+        def recipe_ingredients():
+            for recipe_id in recipe_ids:
+                amount = max(1, round(self.rng.gauss(ingredients_mean, 3)))
+                for ingredient_id in self.rng.sample(
+                    ingredient_ids, min(len(ingredient_ids), amount)
+                ):
+                    yield IngredientRecipe(
+                        recipe_id=recipe_id,
+                        ingredient_id=ingredient_id,
+                        amount=self.rng.randint(1, 500),
+                    )
+
+        self.bulk_create(Recipe.tags.through, recipe_tags())
+        self.bulk_create(IngredientRecipe, recipe_ingredients())
+        refresh_snapshots(recipe_ids, self.batch_size)
+        return recipe_ids
+
+    def create_pairs(self, model, user_ids, recipe_ids, count):
+        """Избранное и корзины: популярные рецепты встречаются чаще."""
+        if not recipe_ids:
+            return
+        shuffled = recipe_ids[:]
+        self.rng.shuffle(shuffled)
+        popular = PowerLawPicker(shuffled, 0.9, self.rng)
+        pairs = self.unique_pairs(
+            model, count, len(user_ids) * len(recipe_ids),
+            lambda: (self.rng.choice(user_ids), popular.pick())
+        )
+        self.bulk_create(model, (
+            model(user_id=user, recipe_id=recipe) for user, recipe in pairs
+        ))
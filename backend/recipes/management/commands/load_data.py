@@ -1,32 +1,155 @@
+import csv
 import json
 import os
+import time
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
 from foodgram.settings import DATA_FILES_DIR
 
+from recipes.catalog import bump_catalog_version
 from recipes.models import Ingredient
+from recipes.utils import iter_batches
+
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def iter_csv(file):
+    """Построчно читает CSV вида "название,единица измерения"."""
+    for row in csv.reader(file):
+        if len(row) >= 2:
+            yield row[0].strip(), row[1].strip()
+
+
+def parse_item(item):
+    """Пара (название, единица измерения) из объекта JSON."""
+    if not isinstance(item, dict):
+        raise CommandError(f'Ожидался объект ингредиента, получено: {item!r}')
+    row = item.get('name'), item.get('measurement_unit')
+    if not all(isinstance(value, str) for value in row):
+        raise CommandError(
+            f'У ингредиента нет name или measurement_unit: {item!r}'
+        )
+    return row
+
+
+def iter_json(file):
+    """
+    Потоково читает JSON-массив объектов.
+
+    Файл читается кусками, объекты разбираются по одному
+    через raw_decode, так что весь массив в память не попадает.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+    for chunk in iter(lambda: file.read(READ_CHUNK_SIZE), ''):
+        buffer = buffer[position:] + chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if not started and buffer[position:position + 1] == '[':
+                started = True
+                position += 1
+                continue
+            if buffer[position:position + 1] in ('', ']'):
+                break
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except ValueError:
+                break
+            yield parse_item(item)
+    if buffer[position:].strip(' \t\r\n,') not in ('', ']'):
+        raise CommandError('Файл JSON обрезан или некорректен.')
 
 
 class Command(BaseCommand):
-    """Загрузчик в БД из JSON файла."""
+    """
+    Загрузчик ингредиентов в БД из CSV или JSON файла.
+
+    Загрузка идемпотентна: ингредиенты с уже существующей парой
+    (название, единица измерения) пропускаются.
+    """
+
+    help = 'Загружает ингредиенты из CSV или JSON файла'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            default=os.path.join(DATA_FILES_DIR, 'ingredients.json'),
+            help='Путь к файлу с ингредиентами (.csv или .json)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Размер пачки для записи в БД',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Показать новые ингредиенты, ничего не записывая',
+        )
 
     def handle(self, *args, **options):
-        file_name = 'ingredients.json'
-        json_path = os.path.join(DATA_FILES_DIR, file_name)
+        path = options['path']
+        _, ext = os.path.splitext(path)
+        readers = {'.csv': iter_csv, '.json': iter_json}
+        if ext.lower() not in readers:
+            raise CommandError(f'Неизвестный формат файла: {path}')
         try:
-            with open(json_path, 'rb') as file:
-                data = json.load(file)
-                ingredients = [
-                    Ingredient(
-                        name=item.get('name'),
-                        measurement_unit=item.get('measurement_unit'),
-                    )
-                    for item in data
-                ]
-                Ingredient.objects.bulk_create(ingredients)
-            print('finished')
+            file = open(path, encoding='utf-8', newline='')
         except FileNotFoundError:
+            raise CommandError(f'Файл {path} не найден.')
+
+        started = time.monotonic()
+        total = created = 0
+        # В пробном запуске БД не меняется: повторы из прошлых пачек
+        # отсекаются по уже показанным строкам.
+        planned = set()
+        with file:
+            rows = readers[ext.lower()](file)
+            for batch in iter_batches(rows, options['batch_size']):
+                total += len(batch)
+                new = self.get_new(batch)
+                if options['dry_run']:
+                    new = [row for row in new if row not in planned]
+                    planned.update(new)
+                    created += len(new)
+                    for name, measurement_unit in new:
+                        self.stdout.write(f'+ {name}, {measurement_unit}')
+                    continue
+                created += len(new)
+                with transaction.atomic():
+                    Ingredient.objects.bulk_create(
+                        [
+                            Ingredient(
+                                name=name,
+                                measurement_unit=measurement_unit,
+                            )
+                            for name, measurement_unit in new
+                        ],
+                        ignore_conflicts=True,
+                    )
+        if created and not options['dry_run']:
+            bump_catalog_version()
+        elapsed = time.monotonic() - started
+        rate = total / elapsed if elapsed else total
+        self.stdout.write(
+            f'Прочитано: {total}, новых: {created}, '
+            f'уже в БД: {total - created}, {rate:.0f} строк/с'
+        )
 
-            print(f'Файл {file_name} не найден.')
-            return
+    @staticmethod
+    def get_new(batch):
+        """Возвращает строки пачки, которых ещё нет в БД."""
+        batch = list(dict.fromkeys(batch))
+        existing = set(
+            Ingredient.objects.filter(
+                name__in={name for name, _ in batch}
+            ).values_list('name', 'measurement_unit')
+        )
+        return [row for row in batch if row not in existing]
@@ -0,0 +1,47 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipes.images import make_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    """Нарезает уменьшенные копии для уже загруженных картинок рецептов."""
+
+    help = 'Нарезает уменьшенные копии картинок рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Перезаписать уже нарезанные копии',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.RECIPE_IMAGE_WORKERS,
+            help='Число потоков',
+        )
+
+    def handle(self, *args, **options):
+        names = (
+            Recipe.objects.exclude(image='')
+            .values_list('image', flat=True)
+            .distinct()
+        )
+        done = failed = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            futures = {
+                executor.submit(make_variants, name, force=options['force']):
+                name for name in names
+            }
+            for future, name in futures.items():
+                try:
+                    future.result()
+                    done += 1
+                except Exception as error:
+                    failed += 1
+                    self.stderr.write(f'{name}: {error}')
+        self.stdout.write(f'Готово: {done}, с ошибками: {failed}')
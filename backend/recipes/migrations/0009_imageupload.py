@@ -0,0 +1,32 @@
+# Generated by Django 2.2.16 on 2026-10-19 10:30
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0008_auto_20221024_1621'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageUpload',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.UUIDField(default=uuid.uuid4, editable=False, unique=True, verbose_name='Токен')),
+                ('image', models.ImageField(upload_to='recipes/images/', verbose_name='Изображение')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Дата загрузки')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='image_uploads', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Загруженное изображение',
+                'verbose_name_plural': 'Загруженные изображения',
+                'ordering': ('-created',),
+            },
+        ),
+    ]
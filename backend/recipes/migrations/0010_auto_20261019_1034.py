@@ -0,0 +1,65 @@
+# Generated by Django 2.2.16 on 2026-10-19 10:34
+
+from django.db import migrations, models
+from django.db.models import Count, F, Min
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    """
+    Сливает повторно загруженные ингредиенты в самый ранний.
+
+    Если рецепт уже использует оставляемый ингредиент, количество
+    дубля прибавляется к нему.
+    """
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    IngredientRecipe = apps.get_model('recipes', 'IngredientRecipe')
+    duplicates = (
+        Ingredient.objects.values('name', 'measurement_unit')
+        .annotate(keep_id=Min('id'), count=Count('id'))
+        .filter(count__gt=1)
+        .order_by()
+    )
+    for duplicate in duplicates:
+        keep_id = duplicate['keep_id']
+        extra_ids = Ingredient.objects.filter(
+            name=duplicate['name'],
+            measurement_unit=duplicate['measurement_unit'],
+        ).exclude(id=keep_id).values_list('id', flat=True)
+        for extra_id in list(extra_ids):
+            recipes_with_keep = IngredientRecipe.objects.filter(
+                ingredient_id=keep_id
+            ).values('recipe_id')
+            merged = IngredientRecipe.objects.filter(
+                ingredient_id=extra_id, recipe_id__in=recipes_with_keep
+            )
+            for recipe_id, amount in merged.values_list('recipe_id', 'amount'):
+                IngredientRecipe.objects.filter(
+                    ingredient_id=keep_id, recipe_id=recipe_id
+                ).update(amount=F('amount') + amount)
+            merged.delete()
+            IngredientRecipe.objects.filter(ingredient_id=extra_id).update(
+                ingredient_id=keep_id
+            )
+            Ingredient.objects.filter(id=extra_id).delete()
+
+
+class Migration(migrations.Migration):
+
+    # Слияние коммитится отдельно: в PostgreSQL ALTER TABLE в одной
+    # транзакции с изменёнными строками падает на отложенных триггерах.
+    atomic = False
+
+    dependencies = [
+        ('recipes', '0009_imageupload'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop,
+            atomic=True
+        ),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient_unit'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 2.2.16 on 2026-10-19 11:11
+
+import json
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def fill_snapshots(apps, schema_editor):
+    """Заполняет копии ингредиентов у существующих рецептов."""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    IngredientRecipe = apps.get_model('recipes', 'IngredientRecipe')
+    ingredients = defaultdict(list)
+    rows = IngredientRecipe.objects.order_by('id').values_list(
+        'recipe_id', 'ingredient_id', 'ingredient__name',
+        'ingredient__measurement_unit', 'amount'
+    )
+    for recipe_id, ingredient_id, name, measurement_unit, amount in rows:
+        ingredients[recipe_id].append({
+            'id': ingredient_id,
+            'name': name,
+            'measurement_unit': measurement_unit,
+            'amount': amount,
+        })
+    Recipe.objects.bulk_update(
+        [
+            Recipe(
+                id=recipe_id,
+                ingredients_snapshot=json.dumps(
+                    items, ensure_ascii=False, separators=(',', ':')
+                ),
+            )
+            for recipe_id, items in ingredients.items()
+        ],
+        ['ingredients_snapshot'],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_auto_20261019_1034'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='ingredients_snapshot',
+            field=models.TextField(default='[]', editable=False, verbose_name='Ингредиенты (копия)'),
+        ),
+        migrations.RunPython(fill_snapshots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 2.2.16 on 2026-10-19 11:37
+
+from django.db import migrations, models
+
+
+def mark_existing_variants(apps, schema_editor):
+    """Отмечает картинки, копии которых уже нарезаны."""
+    from recipes.images import has_variants
+
+    Recipe = apps.get_model('recipes', 'Recipe')
+    names = (
+        Recipe.objects.exclude(image='').order_by()
+        .values_list('image', flat=True).distinct()
+    )
+    for name in list(names):
+        if has_variants(name):
+            Recipe.objects.filter(image=name).update(image_variants=name)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_recipe_author_pub_date_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_variants',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100, verbose_name='Картинка с нарезанными копиями'),
+        ),
+        migrations.RunPython(
+            mark_existing_variants, migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 2.2.16 on 2026-10-19 14:05
+
+from django.db import migrations, models
+
+
+def mark_computed(apps, schema_editor):
+    """Отмечает рецепты, соседи которых уже посчитаны."""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    SimilarRecipe = apps.get_model('recipes', 'SimilarRecipe')
+    Recipe.objects.filter(
+        id__in=SimilarRecipe.objects.values('recipe_id')
+    ).update(similar_computed=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0014_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='similar_computed',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Похожие рецепты посчитаны'),
+        ),
+        migrations.RunPython(mark_computed, migrations.RunPython.noop),
+    ]
@@ -1,9 +1,14 @@
+import datetime
+import uuid
+
+from django.conf import settings
 from django.core.validators import (
     MaxValueValidator,
     MinValueValidator,
     RegexValidator
 )
 from django.db import models
+from django.utils import timezone
 
 from users.models import User
 
@@ -22,6 +27,12 @@ class Ingredient(models.Model):
         ordering = ('id',)
         verbose_name = 'Ингредиент'
         verbose_name_plural = "Ингредиенты"
+        constraints = (
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient_unit'
+            ),
+        )
 
     def __str__(self):
         return self.name
@@ -96,11 +107,38 @@ class Recipe(models.Model):
         verbose_name='дата публикации',
         db_index=True
     )
+    # Копия ingredients в JSON для чтения без join, см. recipes.snapshots.
+    ingredients_snapshot = models.TextField(
+        'Ингредиенты (копия)',
+        default='[]',
+        editable=False
+    )
+    # Картинка, копии которой уже нарезаны, см. recipes.images.
+    image_variants = models.CharField(
+        'Картинка с нарезанными копиями',
+        max_length=100,
+        blank=True,
+        default='',
+        editable=False
+    )
+    # Соседи посчитаны, даже если их нет, см. recipes.similarity.
+    similar_computed = models.BooleanField(
+        'Похожие рецепты посчитаны',
+        default=False,
+        editable=False
+    )
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date',)
+        # Последние рецепты автора: подписки и страница автора.
+        indexes = [
+            models.Index(
+                fields=('author', '-pub_date'),
+                name='recipe_author_pub_date_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -211,3 +249,86 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f'{self.recipe} в списке покупок у {self.user}'
+
+
+class SimilarRecipe(models.Model):
+    """
+    Модель SimilarRecipe.
+
+    Хранит заранее посчитанных соседей рецепта по ингредиентам,
+    см. recipes.similarity.
+    """
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_recipes',
+        verbose_name='Рецепт'
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Похожий рецепт'
+    )
+    score = models.FloatField('Сходство')
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        ordering = ('recipe', '-score')
+        constraints = (
+            models.UniqueConstraint(
+                fields=['recipe', 'similar'],
+                name='unique_similar_recipe'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.similar} похож на {self.recipe}'
+
+
+class ImageUpload(models.Model):
+    """
+    Модель ImageUpload.
+
+    Хранит картинку, загруженную отдельным запросом, до тех пор,
+    пока её не привяжут к рецепту по токену. Загрузки старше
+    IMAGE_UPLOAD_TTL недействительны и удаляются collect_media.
+    """
+
+    token = models.UUIDField(
+        'Токен',
+        default=uuid.uuid4,
+        unique=True,
+        editable=False
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='image_uploads',
+        verbose_name='Пользователь'
+    )
+    image = models.ImageField(
+        'Изображение',
+        upload_to='recipes/images/',
+    )
+    created = models.DateTimeField(
+        'Дата загрузки',
+        auto_now_add=True
+    )
+
+    class Meta:
+        verbose_name = 'Загруженное изображение'
+        verbose_name_plural = 'Загруженные изображения'
+        ordering = ('-created',)
+
+    def __str__(self):
+        return f'{self.image} загружено {self.user}'
+
+    @staticmethod
+    def expires_before():
+        """Загрузки, созданные раньше этого момента, просрочены."""
+        return timezone.now() - datetime.timedelta(
+            seconds=settings.IMAGE_UPLOAD_TTL
+        )
@@ -0,0 +1,41 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .catalog import bump_catalog_version
+from .images import schedule_variants
+from .models import Ingredient, Recipe
+from .snapshots import recipes_with_ingredient, refresh_snapshots
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_variants(sender, instance, **kwargs):
+    """После сохранения рецепта нарезает копии его картинки."""
+    name = instance.image.name
+    if name:
+        transaction.on_commit(lambda: schedule_variants(name))
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredient_changed(sender, **kwargs):
+    """Каталог ингредиентов пересобирается после коммита изменений."""
+    transaction.on_commit(bump_catalog_version)
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_renamed(sender, instance, created, **kwargs):
+    """Новое название и единица попадают в копии ингредиентов рецептов."""
+    if not created:
+        refresh_snapshots(recipes_with_ingredient(instance.id))
+
+
+@receiver(pre_delete, sender=Ingredient)
+def ingredient_deleting(sender, instance, **kwargs):
+    # После удаления связей рецепты ингредиента уже не найти.
+    instance.snapshot_recipe_ids = recipes_with_ingredient(instance.id)
+
+
+@receiver(post_delete, sender=Ingredient)
+def ingredient_deleted(sender, instance, **kwargs):
+    refresh_snapshots(getattr(instance, 'snapshot_recipe_ids', []))
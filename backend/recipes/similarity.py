@@ -0,0 +1,262 @@
+from collections import defaultdict
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min
+from scipy import sparse
+
+from .models import IngredientRecipe, Recipe, SimilarRecipe
+from .utils import iter_batches
+
+
+class IngredientMatrix:
+    """
+    Разреженная матрица рецепт × ингредиент с весами IDF.
+
+    Строки нормированы, поэтому произведение двух строк — косинусное
+    сходство рецептов: общий редкий ингредиент весит больше общей
+    соли. Количество ингредиента не учитывается, единицы у рецептов
+    разные.
+    """
+
+    def __init__(self):
+        pairs = np.array(
+            IngredientRecipe.objects.values_list('recipe_id', 'ingredient_id'),
+            dtype=np.int64,
+        ).reshape(-1, 2)
+        self.recipe_ids, rows = np.unique(pairs[:, 0], return_inverse=True)
+        ingredient_ids, columns = np.unique(pairs[:, 1], return_inverse=True)
+        matrix = sparse.csr_matrix(
+            (np.ones(len(pairs), dtype=np.float32), (rows, columns)),
+            shape=(len(self.recipe_ids), len(ingredient_ids)),
+        )
+        frequency = np.bincount(columns, minlength=len(ingredient_ids))
+        # Оценка сверху числа рецептов с общим ингредиентом для каждой
+        # строки: по ней blocks ограничивает размер произведения.
+        self.bounds = matrix @ frequency
+        idf = np.log((1 + len(self.recipe_ids)) / (1 + frequency)) + 1
+        matrix = matrix @ sparse.diags(idf.astype(np.float32))
+        norms = np.sqrt(matrix.multiply(matrix).sum(axis=1)).A1
+        norms[norms == 0] = 1
+        self.matrix = (sparse.diags(1 / norms) @ matrix).tocsr()
+        self.index = {
+            recipe_id: row for row, recipe_id in enumerate(self.recipe_ids)
+        }
+
+    def rows(self, recipe_ids):
+        return [self.index[pk] for pk in recipe_ids if pk in self.index]
+
+    def blocks(self, rows):
+        """
+        Сходство строк rows со всеми рецептами частями.
+
+        Строки делятся так, чтобы в произведении разреженных матриц
+        было не больше SIMILAR_MAX_SCORES значений, иначе общие
+        ингредиенты вроде соли дали бы пачку × весь каталог. Выдаёт
+        пары (строки части, матрица сходства части).
+        """
+        chunk, size = [], 0
+        for row in rows:
+            if chunk and size + self.bounds[row] > settings.SIMILAR_MAX_SCORES:
+                yield chunk, (self.matrix[chunk] @ self.matrix.T).tocsr()
+                chunk, size = [], 0
+            chunk.append(row)
+            size += self.bounds[row]
+        if chunk:
+            yield chunk, (self.matrix[chunk] @ self.matrix.T).tocsr()
+
+    def neighbours(self, rows, top_k):
+        """
+        Соседи рецептов строк rows по убыванию сходства.
+
+        Результат: {id рецепта: [(id соседа, сходство)]}, не больше
+        top_k соседей на рецепт.
+        """
+        result = {}
+        for chunk, scores in self.blocks(rows):
+            for position, row in enumerate(chunk):
+                start = scores.indptr[position]
+                end = scores.indptr[position + 1]
+                columns = scores.indices[start:end]
+                values = scores.data[start:end]
+                keep = (columns != row) & (values > 0)
+                columns, values = columns[keep], values[keep]
+                if len(values) > top_k:
+                    best = np.argpartition(-values, top_k)[:top_k]
+                    columns, values = columns[best], values[best]
+                order = np.lexsort((columns, -values))
+                result[int(self.recipe_ids[row])] = [
+                    (int(self.recipe_ids[column]), float(value))
+                    for column, value in zip(columns[order], values[order])
+                ]
+        return result
+
+    def reverse_neighbours(self, rows, floor, top_k):
+        """
+        Рецепты, в чьи списки соседей попадают рецепты строк rows.
+
+        floor — сходство последнего соседа каждой строки матрицы, если
+        её список полон, иначе 0: кандидатом считается только пара
+        сильнее. Каждому рецепту достаётся не больше top_k лучших
+        кандидатов. Результат: {id рецепта строки: [(id рецепта,
+        в чей список он попадает, сходство)]}.
+        """
+        sources, columns, values = [], [], []
+        for chunk, scores in self.blocks(rows):
+            scores = scores.tocoo()
+            chunk = np.asarray(chunk)
+            keep = (
+                (scores.data > floor[scores.col])
+                & (scores.col != chunk[scores.row])
+            )
+            sources.append(chunk[scores.row[keep]])
+            columns.append(scores.col[keep])
+            values.append(scores.data[keep])
+        result = {int(self.recipe_ids[row]): [] for row in rows}
+        if not sources:
+            return result
+        sources = np.concatenate(sources)
+        columns = np.concatenate(columns)
+        values = np.concatenate(values)
+        order = np.lexsort((-values, columns))
+        sources, columns, values = (
+            sources[order], columns[order], values[order]
+        )
+        # Место кандидата среди кандидатов того же рецепта.
+        starts = np.flatnonzero(np.r_[True, np.diff(columns) != 0])
+        lengths = np.diff(np.r_[starts, len(columns)])
+        ranks = np.arange(len(columns)) - np.repeat(starts, lengths)
+        for source, column, value in zip(
+            sources[ranks < top_k], columns[ranks < top_k],
+            values[ranks < top_k]
+        ):
+            result[int(self.recipe_ids[source])].append(
+                (int(self.recipe_ids[column]), float(value))
+            )
+        return result
+
+
+def save_neighbours(neighbours):
+    """
+    Переписывает соседей рецептов одной транзакцией.
+
+    Рецепты отмечаются посчитанными и с пустым списком соседей, иначе
+    --incremental считал бы их заново при каждом запуске.
+    """
+    recipe_ids = list(neighbours)
+    with transaction.atomic():
+        SimilarRecipe.objects.filter(recipe_id__in=recipe_ids).delete()
+        SimilarRecipe.objects.bulk_create(
+            SimilarRecipe(recipe_id=recipe_id, similar_id=similar_id,
+                          score=score)
+            for recipe_id, items in neighbours.items()
+            for similar_id, score in items
+        )
+        Recipe.objects.filter(
+            id__in=recipe_ids, similar_computed=False
+        ).update(similar_computed=True)
+
+
+def clear_without_ingredients():
+    """
+    Удаляет соседей рецептов без ингредиентов.
+
+    Такие рецепты в матрицу не попадают, и их прежние соседи иначе
+    остались бы навсегда.
+    """
+    recipes = Recipe.objects.exclude(
+        id__in=IngredientRecipe.objects.values('recipe_id')
+    )
+    with transaction.atomic():
+        SimilarRecipe.objects.filter(recipe__in=recipes).delete()
+        recipes.filter(similar_computed=False).update(similar_computed=True)
+
+
+def rebuild(matrix, top_k, batch_size):
+    """Пересчитывает соседей всех рецептов пачками по batch_size строк."""
+    for rows in iter_batches(range(len(matrix.recipe_ids)), batch_size):
+        save_neighbours(matrix.neighbours(rows, top_k))
+    clear_without_ingredients()
+    return len(matrix.recipe_ids)
+
+
+def pending_recipe_ids():
+    """Рецепты, для которых соседи ещё не считались."""
+    return list(
+        Recipe.objects.filter(similar_computed=False)
+        .values_list('id', flat=True)
+    )
+
+
+def current_neighbours(recipe_ids, batch_size):
+    neighbours = defaultdict(list)
+    for batch in iter_batches(recipe_ids, batch_size):
+        rows = SimilarRecipe.objects.filter(recipe_id__in=batch).values_list(
+            'recipe_id', 'similar_id', 'score'
+        )
+        for recipe_id, similar_id, score in rows:
+            neighbours[recipe_id].append((similar_id, score))
+    return neighbours
+
+
+def neighbour_floor(matrix, top_k):
+    """
+    Сходство последнего соседа каждой строки матрицы.
+
+    Для рецептов, у которых соседей меньше top_k, — 0: в их список
+    попадёт любой похожий рецепт.
+    """
+    floor = np.zeros(len(matrix.recipe_ids), dtype=np.float32)
+    rows = (
+        SimilarRecipe.objects.order_by().values('recipe_id')
+        .annotate(count=Count('id'), last=Min('score'))
+        .filter(count__gte=top_k).values_list('recipe_id', 'last')
+    )
+    for recipe_id, last in rows.iterator():
+        if recipe_id in matrix.index:
+            floor[matrix.index[recipe_id]] = last
+    return floor
+
+
+def merge_new_recipes(scores, top_k, batch_size):
+    """Вставляет новые рецепты в списки соседей похожих старых рецептов."""
+    candidates = defaultdict(list)
+    for recipe_id, items in scores.items():
+        for similar_id, score in items:
+            if similar_id not in scores:
+                candidates[similar_id].append((recipe_id, score))
+    current = current_neighbours(list(candidates), batch_size)
+    changed = {}
+    for recipe_id, items in candidates.items():
+        kept = [item for item in current[recipe_id] if item[0] not in scores]
+        merged = sorted(kept + items, key=lambda item: -item[1])[:top_k]
+        if any(similar_id in scores for similar_id, _ in merged):
+            changed[recipe_id] = merged
+    for batch in iter_batches(changed.items(), batch_size):
+        save_neighbours(dict(batch))
+
+
+def add_recipes(matrix, recipe_ids, top_k, batch_size):
+    """
+    Добавляет новые рецепты без полного пересчёта.
+
+    Новому рецепту соседи считаются по всей матрице, а сам он
+    попадает в списки старых рецептов, если похож на них сильнее их
+    последнего соседа. Списки новых рецептов считаются целиком, поэтому
+    в них через merge_new_recipes ничего не вставляется.
+    """
+    added = 0
+    new_rows = matrix.rows(recipe_ids)
+    floor = neighbour_floor(matrix, top_k)
+    floor[new_rows] = np.inf
+    for rows in iter_batches(new_rows, batch_size):
+        save_neighbours(matrix.neighbours(rows, top_k))
+        merge_new_recipes(
+            matrix.reverse_neighbours(rows, floor, top_k), top_k, batch_size
+        )
+        added += len(rows)
+    missing = [pk for pk in recipe_ids if pk not in matrix.index]
+    for batch in iter_batches(missing, batch_size):
+        save_neighbours(dict.fromkeys(batch, []))
+    return added
@@ -0,0 +1,60 @@
+import json
+from collections import defaultdict
+
+from .models import IngredientRecipe, Recipe
+
+
+def dump_snapshot(ingredients):
+    return json.dumps(ingredients, ensure_ascii=False, separators=(',', ':'))
+
+
+def collect_ingredients(recipe_ids):
+    """Ингредиенты рецептов по таблице IngredientRecipe одним запросом."""
+    ingredients = defaultdict(list)
+    rows = (
+        IngredientRecipe.objects.filter(recipe_id__in=recipe_ids)
+        .order_by('id')
+        .values_list(
+            'recipe_id', 'ingredient_id', 'ingredient__name',
+            'ingredient__measurement_unit', 'amount'
+        )
+    )
+    for recipe_id, ingredient_id, name, measurement_unit, amount in rows:
+        ingredients[recipe_id].append({
+            'id': ingredient_id,
+            'name': name,
+            'measurement_unit': measurement_unit,
+            'amount': amount,
+        })
+    return {
+        recipe_id: dump_snapshot(ingredients[recipe_id])
+        for recipe_id in recipe_ids
+    }
+
+
+def refresh_snapshots(recipe_ids, batch_size=500):
+    """Переписывает Recipe.ingredients_snapshot у рецептов recipe_ids."""
+    recipe_ids = list(recipe_ids)
+    snapshots = {}
+    for start in range(0, len(recipe_ids), batch_size):
+        batch = collect_ingredients(recipe_ids[start:start + batch_size])
+        Recipe.objects.bulk_update(
+            [
+                Recipe(id=recipe_id, ingredients_snapshot=snapshot)
+                for recipe_id, snapshot in batch.items()
+            ],
+            ['ingredients_snapshot'],
+        )
+        snapshots.update(batch)
+    return snapshots
+
+
+def refresh_snapshot(recipe):
+    recipe.ingredients_snapshot = refresh_snapshots([recipe.id])[recipe.id]
+
+
+def recipes_with_ingredient(ingredient_id):
+    return list(
+        IngredientRecipe.objects.filter(ingredient_id=ingredient_id)
+        .values_list('recipe_id', flat=True)
+    )
@@ -0,0 +1,53 @@
+import hashlib
+import os
+import re
+import uuid
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+# Производные файлы (уменьшенные копии) уже названы по хэшу оригинала.
+DERIVED_NAME_RE = re.compile(r'^[0-9a-f]{64}_\w+\.\w+$')
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Файловое хранилище, в котором имя файла — sha256 его содержимого.
+
+    recipes/images/temp.png сохраняется как
+    recipes/images/ab/ab12...ef.png. Одинаковые файлы записываются
+    один раз, поэтому содержимое по имени никогда не меняется и
+    nginx может отдавать его с immutable-заголовками. Файлы, на которые
+    больше нет ссылок, удаляет команда collect_media.
+    """
+
+    def _save(self, name, content):
+        if not DERIVED_NAME_RE.match(os.path.basename(name)):
+            name = self.hashed_name(name, content)
+        if self.exists(name):
+            # Продлеваем жизнь файлу, чтобы collect_media
+            # не удалил его до коммита ссылающейся записи.
+            os.utime(self.path(name))
+            return name
+        # Пишем во временный файл и атомарно переименовываем: параллельная
+        # запись того же содержимого просто заменит файл таким же.
+        temp_name = super()._save(f'{name}.{uuid.uuid4().hex}.tmp', content)
+        os.replace(self.path(temp_name), self.path(name))
+        return name
+
+    def get_available_name(self, name, max_length=None):
+        # Имя определяется содержимым, подбирать свободное не нужно.
+        return name
+
+    @staticmethod
+    def hashed_name(name, content):
+        """Строит имя файла по хэшу содержимого."""
+        sha256 = hashlib.sha256()
+        for chunk in content.chunks():
+            sha256.update(chunk)
+        content.seek(0)
+        digest = sha256.hexdigest()
+        directory, filename = os.path.split(name)
+        _, ext = os.path.splitext(filename)
+        return os.path.join(directory, digest[:2], digest + ext.lower())
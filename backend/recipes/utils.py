@@ -0,0 +1,31 @@
+import bisect
+import itertools
+
+
+def iter_batches(rows, size):
+    """Группирует строки в пачки по size штук."""
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+class PowerLawPicker:
+    """
+    Выбирает элементы с вероятностью, убывающей как 1 / rank ** alpha.
+
+    Первые элементы списка — самые популярные.
+    """
+
+    def __init__(self, items, alpha, rng):
+        self.items = list(items)
+        self.rng = rng
+        self.cum_weights = list(itertools.accumulate(
+            1 / rank ** alpha for rank in range(1, len(self.items) + 1)
+        ))
+
+    def pick(self):
+        point = self.rng.random() * self.cum_weights[-1]
+        return self.items[bisect.bisect(self.cum_weights, point)]
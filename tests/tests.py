@@ -1,17 +1,95 @@
 #!-*-coding:utf-8-*-
 import base64
+import datetime
+import decimal
+import gzip
+import io
 import json
+import os
+import random
+import shutil
+import subprocess
 import tempfile
+import uuid
+from collections import Counter
+from unittest import mock
 
 from PIL import Image
-from django.test import TestCase
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile, File
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.db.models import Count
+from django.test import TestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
 from rest_framework import status
 from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.serializers import ValidationError
 from rest_framework.test import APIClient
 
-from recipes.models import Ingredient, Tag, Recipe
-from users.models import User
+from api.authentication import token_cache_key
+from api.db_router import (
+    ReplicaRouter,
+    is_pinned,
+    pin_to_primary,
+    replica_reads
+)
+from api.fields import Base64ImageField
+from api.instrumentation import collect_stats
+from api.metrics import registry
+from api.nplusone import NPlusOneError, detect_n_plus_one
+from api.parsers import FastJSONParser
+from api.renderers import FastJSONRenderer
+from api.viewer_ids import RecipeIdSet, load_ids, refresh_ids
+from foodgram.db.sqlite3.base import DatabaseWrapper
+from foodgram.invalidation import (
+    CacheStore,
+    FileStore,
+    InvalidationBus,
+    bus
+)
+from foodgram.shared_cache import SharedMemoryCache
+from recipes.catalog import bump_catalog_version
+from recipes.images import make_variants, variant_name, variant_urls
+from recipes.models import (
+    Favorite,
+    ImageUpload,
+    Ingredient,
+    Recipe,
+    ShoppingCart,
+    SimilarRecipe,
+    Tag
+)
+from recipes.similarity import IngredientMatrix, pending_recipe_ids
+from recipes.snapshots import refresh_snapshot
+from recipes.utils import PowerLawPicker, iter_batches
+from users.models import Follow, User
+
+
+# Каждый запрос к API в тестах проверяется на N+1.
+n_plus_one_detection = override_settings(NPLUSONE_DETECTION='raise')
+# Картинки, метрики и прочие файлы тестов; удаляется после прогона.
+TEST_DIR = tempfile.mkdtemp(prefix='foodgram-tests-')
+
+
+def temp_dir():
+    return tempfile.mkdtemp(dir=TEST_DIR)
+
+
+def setUpModule():
+    n_plus_one_detection.enable()
+
+
+def tearDownModule():
+    n_plus_one_detection.disable()
+    shutil.rmtree(TEST_DIR, ignore_errors=True)
 
 
 class ReciepeViewTestCase(TestCase):
@@ -31,6 +109,7 @@ class ReciepeViewTestCase(TestCase):
         cls.token = Token.objects.create(user=cls.user)
 
     def setUp(self) -> None:
+        cache.clear()
         self.amount = 22
         self.ing_salt = Ingredient.objects.create(
             name='salt',
@@ -69,6 +148,7 @@ class ReciepeViewTestCase(TestCase):
             self.ing_salt,
             through_defaults={'amount': self.amount}
         )
+        refresh_snapshot(recipe)
         return recipe
 
     def test_create_recipe(self):
@@ -98,6 +178,51 @@ class ReciepeViewTestCase(TestCase):
         self.assertEqual(resp.data.get('id'), recipe.id)
         self.assertEqual(recipe.ingredients.last().id, self.ing_salt.id)
 
+    @override_settings(MEDIA_ROOT=temp_dir())
+    def test_create_recipe_multipart(self):
+        """Тест создания рецепта через multipart/form-data."""
+        data = {
+            'ingredients': json.dumps([{'id': self.ing_salt.id, 'amount': 3}]),
+            'tags': [self.tag1.pk, self.tag2.pk],
+            'name': 'pay',
+            'text': 'cook pay',
+            'cooking_time': 1,
+            'image': self.tmp_file,
+        }
+
+        resp = self.api_client.post(self.url, data=data, format='multipart')
+
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        recipe = Recipe.objects.get(id=resp.data['id'])
+        self.assertEqual(recipe.tags.count(), 2)
+        self.assertEqual(recipe.ingredient_amounts.get().amount, 3)
+
+    @override_settings(MEDIA_ROOT=temp_dir())
+    def test_upload_image(self):
+        """Тест загрузки картинки отдельным запросом по токену."""
+        resp = self.api_client.post(
+            reverse('api:recipes-upload-image'),
+            data=self.tmp_file.read(),
+            content_type='image/jpeg',
+        )
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        token = resp.data['token']
+
+        data = {
+            'ingredients': [{'id': self.ing_salt.id, 'amount': 10}],
+            'tags': [self.tag1.pk],
+            'name': 'pay',
+            'text': 'cook pay',
+            'cooking_time': 1,
+            'image_token': token,
+        }
+        resp = self.api_client.post(self.url, data=data, format='json')
+
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        recipe = Recipe.objects.get(id=resp.data['id'])
+        self.assertTrue(recipe.image.name.endswith('.jpeg'))
+        self.assertFalse(ImageUpload.objects.filter(token=token).exists())
+
     def test_list(self):
         recipe = self.create_recipe()
 
@@ -109,3 +234,1117 @@ class ReciepeViewTestCase(TestCase):
         ing_data = resp_data['ingredients'][0]
         self.assertEqual(ing_data['id'], recipe.ingredients.last().id)
         self.assertEqual(ing_data['amount'], self.amount)
+
+    @override_settings(MEDIA_ROOT=temp_dir())
+    def test_projection_contract(self):
+        """Проекции отдают тот же JSON, что и сериализаторы."""
+        author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass',
+        )
+        first = self.create_recipe(author=author, text=None)
+        first.tags.add(self.tag2)
+        second = self.create_recipe(
+            image=default_storage.save(
+                'recipes/images/contract.jpg', File(self.tmp_file)
+            )
+        )
+        Favorite.objects.create(user=self.user, recipe=first)
+        ShoppingCart.objects.create(user=self.user, recipe=second)
+        refresh_ids('favorites', self.user.id)
+        refresh_ids('shopping_cart', self.user.id)
+        Follow.objects.create(user=self.user, following=author)
+
+        requests = (
+            (self.api_client, self.url, {}),
+            (APIClient(), self.url, {}),
+            (self.api_client, self.url, {'view': 'compact'}),
+            (self.api_client, self.url, {'omit': 'ingredients,text'}),
+            (
+                self.api_client, reverse('api:users-subscriptions'),
+                {'recipes_limit': 1},
+            ),
+        )
+        for client, url, params in requests:
+            with self.subTest(url=url):
+                with self.settings(PROJECTION_READS=False):
+                    expected = client.get(url, params)
+                actual = client.get(url, params)
+                self.assertEqual(actual.status_code, status.HTTP_200_OK)
+                self.assertEqual(actual.content, expected.content)
+
+    def test_public_cache_headers(self):
+        """Анонимам ответ кэшируется публично, с токеном — приватно."""
+        self.create_recipe()
+
+        resp = APIClient().get(self.url)
+        self.assertIn('public', resp['Cache-Control'])
+        self.assertIn('max-age=', resp['Cache-Control'])
+        self.assertIn('Authorization', resp['Vary'])
+        resp = self.api_client.get(self.url)
+        self.assertIn('private', resp['Cache-Control'])
+        self.assertIn('Authorization', resp['Vary'])
+
+    def test_viewer_ids(self):
+        """Флаги избранного и корзины берутся из кэша без запросов."""
+        recipes = [self.create_recipe() for _ in range(3)]
+        ids = [recipe.id for recipe in recipes]
+        self.api_client.post(reverse('api:recipes-favorite', args=[ids[2]]))
+        self.api_client.post(reverse('api:recipes-favorite', args=[ids[0]]))
+        refresh_ids('favorites', self.user.id)
+
+        favorites = load_ids('favorites', self.user.id)
+        self.assertEqual(list(favorites.ids), [ids[0], ids[2]])
+        self.assertNotIn(ids[1], favorites)
+        self.assertEqual(len(RecipeIdSet()), 0)
+
+        with self.assertNumQueries(3):
+            resp = self.api_client.get(self.url, {'fields': 'id,is_favorited'})
+        flags = {row['id']: row['is_favorited'] for row in resp.json()['results']}
+        self.assertEqual(flags, {ids[0]: True, ids[1]: False, ids[2]: True})
+
+        self.api_client.delete(
+            reverse('api:recipes-favorite', args=[ids[0]])
+        )
+        refresh_ids('favorites', self.user.id)
+        self.assertNotIn(ids[0], load_ids('favorites', self.user.id))
+
+    def test_viewer_ids_per_user(self):
+        """Изменение списка одного пользователя не сбрасывает чужие."""
+        other = User.objects.create_user(
+            username='other', email='other@example.com', password='pass',
+        )
+        recipe = self.create_recipe()
+        load_ids('favorites', self.user.id)
+        with mock.patch(
+            'django.db.transaction.on_commit', lambda callback: callback()
+        ):
+            Favorite.objects.create(user=other, recipe=recipe)
+        with self.assertNumQueries(0):
+            load_ids('favorites', self.user.id)
+
+        # Избранное пользователя изменилось в другом воркере.
+        bus.bump_key('favorites', self.user.id)
+        with self.assertNumQueries(1):
+            load_ids('favorites', self.user.id)
+
+    def test_ingredients_snapshot(self):
+        """Ингредиенты отдаются из копии в рецепте и обновляются с ней."""
+        recipe = self.create_recipe()
+        detail = reverse('api:recipes-detail', args=[recipe.id])
+        expected = [{
+            'id': self.ing_salt.id, 'name': 'salt',
+            'measurement_unit': 'g', 'amount': self.amount,
+        }]
+        self.assertEqual(self.api_client.get(detail).json()['ingredients'],
+                         expected)
+
+        self.ing_salt.name = 'соль'
+        self.ing_salt.save()
+        expected[0]['name'] = 'соль'
+        self.assertEqual(self.api_client.get(detail).json()['ingredients'],
+                         expected)
+        call_command('check_snapshots', stdout=io.StringIO())
+
+        Recipe.objects.filter(id=recipe.id).update(ingredients_snapshot='[]')
+        with self.assertRaises(CommandError):
+            call_command('check_snapshots', stdout=io.StringIO())
+        call_command('check_snapshots', fix=True, stdout=io.StringIO())
+        recipe.refresh_from_db()
+        self.assertEqual(json.loads(recipe.ingredients_snapshot), expected)
+
+    def test_sparse_fields(self):
+        """Тест параметров fields, omit и view=compact."""
+        recipe = self.create_recipe()
+        detail = reverse('api:recipes-detail', args=[recipe.id])
+
+        resp = self.api_client.get(self.url, {'view': 'compact'})
+        self.assertEqual(
+            list(resp.json()['results'][0]),
+            ['id', 'author', 'is_favorited', 'is_in_shopping_cart',
+             'name', 'image', 'cooking_time'],
+        )
+        self.assertEqual(
+            list(resp.json()['results'][0]['author']),
+            ['id', 'username', 'first_name', 'last_name'],
+        )
+        resp = self.api_client.get(detail, {'fields': 'name,id'})
+        self.assertEqual(resp.json(), {'id': recipe.id, 'name': recipe.name})
+
+        # Ингредиенты не выбираются, если их не просили.
+        with self.assertNumQueries(5):
+            resp = self.api_client.get(self.url, {'omit': 'ingredients'})
+        self.assertNotIn('ingredients', resp.json()['results'][0])
+
+        resp = self.api_client.get(detail, {'omit': 'calories'})
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @detect_n_plus_one(threshold=2)
+    def test_ingredients_list(self):
+        """Список ингредиентов не делает запросов на каждую строку."""
+        Ingredient.objects.bulk_create([
+            Ingredient(name=f'ing{number}', measurement_unit='g')
+            for number in range(5)
+        ])
+        bump_catalog_version()
+
+        resp = self.api_client.get(reverse('api:ingredients-list'))
+
+        self.assertEqual(len(resp.json()), 6)
+
+    def test_n_plus_one_threshold(self):
+        """Нулевой порог не подменяется порогом из настроек."""
+        with self.assertRaises(NPlusOneError):
+            with detect_n_plus_one(threshold=0):
+                Tag.objects.exists()
+
+    def test_n_plus_one_detected(self):
+        """Повторяющийся из одного места запрос считается N+1."""
+        with self.assertRaisesRegex(NPlusOneError, 'tests.py'):
+            with detect_n_plus_one(threshold=1):
+                for tag in Tag.objects.all():
+                    Recipe.objects.filter(tags=tag).exists()
+
+    def test_profiling(self):
+        """Тест профилирования запроса по заголовку X-Profile."""
+        for mode, ext in (('sampler', '.collapsed'), ('cprofile', '.pstats')):
+            profiles = temp_dir()
+            with self.settings(
+                PROFILING_TOKEN='secret', PROFILING_DIR=profiles,
+                PROFILING_MODE=mode, PROFILING_MAX_FILES=1,
+            ):
+                client = APIClient()
+                client.get(self.url, HTTP_X_PROFILE='secret')
+                client.get(self.url, HTTP_X_PROFILE='secret')
+                client.get(self.url, HTTP_X_PROFILE='wrong')
+
+            files = os.listdir(os.path.join(profiles, 'api_recipes-list'))
+            self.assertEqual(files[0][-len(ext):], ext)
+            self.assertEqual(len(files), 1)
+
+        output = io.StringIO()
+        with self.settings(PROFILING_DIR=profiles):
+            call_command('profile_report', stdout=output)
+        self.assertIn('api_recipes-list: профилей 1', output.getvalue())
+
+    @override_settings(METRICS_DIR=temp_dir(), METRICS_TOKEN='m')
+    def test_server_timing(self):
+        """Тест заголовка Server-Timing и эндпоинта метрик."""
+        self.create_recipe()
+
+        resp = self.api_client.get(self.url)
+
+        self.assertIn('db;dur=', resp['Server-Timing'])
+        self.assertIn('serialization;dur=', resp['Server-Timing'])
+        metrics_url = reverse('api:metrics')
+        self.assertEqual(
+            self.api_client.get(metrics_url).status_code,
+            status.HTTP_403_FORBIDDEN
+        )
+        metrics = self.client.get(metrics_url, HTTP_AUTHORIZATION='Bearer m')
+        self.assertIn(
+            'foodgram_request_total_seconds_count'
+            '{route="api:recipes-list",method="GET"}',
+            metrics.content.decode()
+        )
+
+    def test_stale_metrics_files(self):
+        """Файлы завершившихся воркеров не попадают в метрики."""
+        metrics_dir = temp_dir()
+        finished = subprocess.Popen(['true'])
+        finished.wait()
+        stale = [
+            f'metrics-{finished.pid}-old.json',
+            f'metrics-{os.getpid()}-old.json',
+        ]
+        for name in stale:
+            with open(os.path.join(metrics_dir, name), 'w') as file:
+                json.dump({'histograms': [], 'queries': []}, file)
+        with self.settings(METRICS_DIR=metrics_dir):
+            self.assertEqual(len(registry.collect()), 1)
+        self.assertEqual(os.listdir(metrics_dir), [registry.name()])
+
+
+class Base64ImageFieldTestCase(TestCase):
+    """Тест потокового декодирования картинок из base64."""
+
+    @staticmethod
+    def make_data_uri(size=(10, 10), image_format='PNG'):
+        buffer = io.BytesIO()
+        Image.new('RGB', size).save(buffer, format=image_format)
+        encoded = base64.b64encode(buffer.getvalue()).decode('utf-8')
+        return f'data:image/{image_format.lower()};base64,{encoded}'
+
+    def test_decode(self):
+        field = Base64ImageField()
+
+        image = field.to_internal_value(self.make_data_uri())
+
+        self.assertEqual(image.name, 'temp.png')
+        self.assertEqual(Image.open(image).size, (10, 10))
+
+    def test_decode_to_disk(self):
+        field = Base64ImageField()
+
+        with self.settings(FILE_UPLOAD_MAX_MEMORY_SIZE=100):
+            image = field.to_internal_value(
+                self.make_data_uri(size=(200, 200), image_format='JPEG')
+            )
+
+        self.assertTrue(hasattr(image, 'temporary_file_path'))
+        self.assertEqual(image.name, 'temp.jpeg')
+
+    def test_line_wrapped(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (200, 200)).save(buffer, format='JPEG')
+        size = len(buffer.getvalue())
+        encoded = base64.encodebytes(buffer.getvalue()).decode('utf-8')
+        data = 'data:image/jpeg;base64,' + encoded.replace('\n', '\r\n')
+
+        image = Base64ImageField(max_size=size).to_internal_value(data)
+
+        self.assertEqual(image.size, size)
+        with self.assertRaises(ValidationError):
+            Base64ImageField(max_size=size - 1).to_internal_value(data)
+
+    def test_limits(self):
+        with self.assertRaises(ValidationError):
+            Base64ImageField(max_size=10).to_internal_value(
+                self.make_data_uri()
+            )
+        with self.assertRaises(ValidationError):
+            Base64ImageField(max_dimension=5).to_internal_value(
+                self.make_data_uri()
+            )
+        with self.assertRaises(ValidationError):
+            Base64ImageField().to_internal_value(
+                'data:image/png;base64,'
+                + base64.b64encode(b'not an image').decode('utf-8')
+            )
+
+
+@override_settings(MEDIA_ROOT=temp_dir())
+class ImageVariantsTestCase(TestCase):
+    """Тест нарезки уменьшенных копий картинок."""
+
+    def test_make_variants(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (2000, 1000)).save(buffer, format='PNG')
+        name = default_storage.save(
+            'recipes/images/big.png', ContentFile(buffer.getvalue())
+        )
+        author = User.objects.create_user(
+            username='painter', email='painter@example.com', password='pass',
+        )
+        recipe = Recipe.objects.create(
+            author=author, name='Каша', text='', cooking_time=5, image=name
+        )
+        self.assertEqual(
+            variant_urls(name, False)['card']['jpeg'],
+            default_storage.url(name)
+        )
+
+        make_variants(name)
+
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.image_variants, name)
+        # Готовность копий берётся из рецепта, файлы не проверяются.
+        with mock.patch(
+            'recipes.storage.ContentAddressedStorage.exists'
+        ) as exists:
+            response = APIClient().get(reverse('api:recipes-list'))
+        exists.assert_not_called()
+        self.assertEqual(
+            response.json()['results'][0]['images']['card']['webp'],
+            'http://testserver'
+            + default_storage.url(variant_name(name, 'card', 'webp'))
+        )
+        urls = variant_urls(name, True)
+        self.assertEqual(
+            urls['card']['webp'],
+            default_storage.url(variant_name(name, 'card', 'webp'))
+        )
+        thumbnail = variant_name(name, 'thumbnail', 'jpeg')
+        with default_storage.open(thumbnail) as f:
+            self.assertEqual(Image.open(f).size, (300, 150))
+
+    def test_deduplicated_storage(self):
+        content = b'same content'
+
+        first = default_storage.save('recipes/images/a.png', ContentFile(content))
+        second = default_storage.save(
+            'recipes/images/b.png', ContentFile(content)
+        )
+
+        self.assertEqual(first, second)
+        self.assertRegex(first, r'^recipes/images/[0-9a-f]{2}/[0-9a-f]{64}\.png$')
+
+    def test_collect_expired_uploads(self):
+        user = User.objects.create_user(
+            username='uploader', email='uploader@example.com',
+            password='pass',
+        )
+        expired = ImageUpload.objects.create(
+            user=user, image=default_storage.save(
+                'recipes/images/old.png', ContentFile(b'old upload')
+            )
+        )
+        fresh = ImageUpload.objects.create(
+            user=user, image=default_storage.save(
+                'recipes/images/new.png', ContentFile(b'new upload')
+            )
+        )
+        ImageUpload.objects.filter(pk=expired.pk).update(
+            created=timezone.now() - datetime.timedelta(
+                seconds=settings.IMAGE_UPLOAD_TTL + 1
+            )
+        )
+        client = APIClient()
+        client.force_authenticate(user)
+        resp = client.post(reverse('api:recipes-list'), {
+            'image_token': str(expired.token)
+        }, format='json')
+        self.assertIn('image_token', resp.json())
+
+        call_command('collect_media', min_age=0, stdout=io.StringIO())
+
+        self.assertFalse(ImageUpload.objects.filter(pk=expired.pk).exists())
+        self.assertFalse(default_storage.exists(expired.image.name))
+        self.assertTrue(ImageUpload.objects.filter(pk=fresh.pk).exists())
+        self.assertTrue(default_storage.exists(fresh.image.name))
+
+
+@override_settings(MEDIA_ROOT=temp_dir())
+class BenchmarkTestCase(TestCase):
+    """Тест генератора данных и сравнения с базовым отчётом."""
+
+    def test_benchmark(self):
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+        call_command(
+            'generate_data', users=5, follows=10, recipes=10,
+            favorites=20, carts=10, stdout=io.StringIO()
+        )
+        directory = temp_dir()
+        report = os.path.join(directory, 'report.json')
+        baseline = os.path.join(directory, 'baseline.json')
+        options = {
+            'iterations': 2, 'warmup': 0, 'output': report,
+            'baseline': baseline, 'stdout': io.StringIO(),
+        }
+        with self.assertRaisesMessage(CommandError, '--update-baseline'):
+            call_command('benchmark', **options)
+
+        call_command('benchmark', update_baseline=True, **options)
+        with open(baseline) as file:
+            data = json.load(file)
+        self.assertGreater(data['scenarios']['recipes_list']['queries'], 0)
+        self.assertEqual(data['dataset']['recipes'], 10)
+
+        data['scenarios']['recipes_list']['queries'] = 0
+        with open(baseline, 'w') as file:
+            json.dump(data, file)
+        with self.assertRaises(CommandError):
+            call_command('benchmark', threshold=100, **options)
+
+
+class CachedTokenAuthenticationTestCase(TestCase):
+    """Тест кэширования токенов и сброса кэша."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='cached', email='cached@example.com', password='pass',
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.url = reverse('api:users-me')
+
+    def test_cached_lookup(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+        # Только выборка тегов, без запроса токена с пользователем.
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                self.client.get(reverse('api:tags-list')).status_code, 200
+            )
+
+    def test_invalidation(self):
+        self.client.get(self.url)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+        self.user.is_active = True
+        self.user.save()
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.token.delete()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_logout_in_other_worker(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        # Токен удалён другим воркером: его сигнал чистит кэш того
+        # воркера, сюда доходит только новая версия темы 'auth'.
+        with mock.patch('api.signals.invalidate_token'):
+            self.token.delete()
+        bus.store.bump('auth')
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    @mock.patch.object(bus, '_store', CacheStore())
+    def test_deactivate_with_concurrent_read(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        cache_key = token_cache_key(self.token.key)
+        credentials = cache.get(cache_key)
+        callbacks = []
+        with mock.patch('django.db.transaction.on_commit', callbacks.append):
+            self.user.is_active = False
+            self.user.save()
+            # Параллельный запрос до коммита прочитал старую строку.
+            cache.set(cache_key, credentials)
+            for callback in callbacks:
+                callback()
+            self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_login_keeps_cache(self):
+        self.user.last_login = timezone.now()
+        with mock.patch('api.signals.invalidate_token') as invalidate:
+            self.user.save(update_fields=['last_login'])
+        invalidate.assert_not_called()
+
+
+class ReplicaRouterTestCase(TestCase):
+    """Тест чтения с реплик и закрепления за primary после записи."""
+
+    def setUp(self):
+        cache.clear()
+
+    @override_settings(DATABASE_REPLICAS=['replica_1'])
+    def test_router(self):
+        router = ReplicaRouter()
+        self.assertIsNone(router.db_for_read(Tag))
+        with replica_reads():
+            self.assertEqual(router.db_for_read(Tag), 'replica_1')
+            self.assertEqual(router.db_for_write(Tag), 'default')
+        self.assertIsNone(router.db_for_read(Tag))
+
+    @override_settings(DATABASE_REPLICAS=['replica_1'])
+    def test_cache_refresh_reads_primary(self):
+        url = reverse('api:tags-list')
+        with mock.patch(
+            'api.db_router.random.choice', return_value='default'
+        ) as choice:
+            self.client.get(url, HTTP_X_READ_PRIMARY='1')
+            choice.assert_not_called()
+            self.client.get(url)
+            choice.assert_called()
+
+    @override_settings(REPLICA_PIN_DIR=temp_dir())
+    def test_pin_after_write(self):
+        user = User.objects.create_user(
+            username='pinned', email='pinned@example.com', password='pass',
+        )
+        client = APIClient()
+        client.force_authenticate(user)
+        self.assertFalse(is_pinned(user))
+        response = client.post(
+            reverse('api:users-set-password'),
+            {'current_password': 'pass', 'new_password': 'Very-new-pass1'},
+        )
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertTrue(is_pinned(user))
+
+    @override_settings(REPLICA_PIN_DIR=temp_dir())
+    def test_pin_across_workers(self):
+        user = User.objects.create_user(
+            username='forked', email='forked@example.com', password='pass',
+        )
+        # Запись обработал другой воркер.
+        pid = os.fork()
+        if pid == 0:
+            try:
+                pin_to_primary(user)
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+        self.assertTrue(is_pinned(user))
+        with self.settings(REPLICA_PIN_SECONDS=0):
+            self.assertFalse(is_pinned(user))
+
+
+class ManagedConnectionTestCase(TestCase):
+    """Тест ограничения соединений на воркер и учёта времени подключения."""
+
+    def setUp(self):
+        directory = temp_dir()
+        self.settings_dict = dict(
+            connection.settings_dict,
+            NAME=os.path.join(directory, 'capped.sqlite3'),
+            MAX_CONNECTIONS=1,
+            CONNECTION_WAIT=0.01,
+        )
+
+    def test_max_connections(self):
+        first = DatabaseWrapper(self.settings_dict, alias='capped')
+        second = DatabaseWrapper(self.settings_dict, alias='capped')
+        with collect_stats() as stats:
+            first.ensure_connection()
+        self.assertEqual(stats.connections, 1)
+
+        with self.assertRaises(OperationalError):
+            second.ensure_connection()
+        first.close()
+        second.ensure_connection()
+        second.close()
+
+
+class FastJSONTestCase(TestCase):
+    """Тест совпадения FastJSONRenderer и FastJSONParser со стандартными."""
+
+    def test_same_output(self):
+        data = {
+            'name': gettext_lazy('Рецепт'),
+            'amount': decimal.Decimal('1.50'),
+            'created': datetime.datetime(
+                2022, 1, 2, 3, 4, 5, 678, tzinfo=timezone.utc
+            ),
+            'day': datetime.date(2022, 1, 2),
+            'token': uuid.UUID(int=1),
+            'text': 'строка\u2028с разделителем',
+            1: [None, True, 1.5],
+        }
+        content = FastJSONRenderer().render(data)
+        self.assertEqual(content, JSONRenderer().render(data))
+        self.assertEqual(
+            FastJSONParser().parse(io.BytesIO(content)),
+            JSONParser().parse(io.BytesIO(content)),
+        )
+        with self.assertRaises(ParseError):
+            FastJSONParser().parse(io.BytesIO(b'{"amount": NaN}'))
+
+        big = {'id': 2 ** 64, 'ids': [-2 ** 63 - 1]}
+        self.assertEqual(
+            FastJSONRenderer().render(big), JSONRenderer().render(big)
+        )
+        # Экспоненту orjson пишет иначе, но значения те же.
+        floats = [1e-05, 1e+16, 1.5e+300, 1e-07]
+        self.assertEqual(
+            json.loads(FastJSONRenderer().render(floats)),
+            json.loads(JSONRenderer().render(floats)),
+        )
+
+    def test_api_response(self):
+        Tag.objects.create(name='Завтрак', color='#E26C2D', slug='breakfast')
+        response = self.client.get(reverse('api:tags-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.content, JSONRenderer().render(response.data)
+        )
+
+
+class IngredientCatalogTestCase(TestCase):
+    """Тест каталога ингредиентов в памяти."""
+
+    def setUp(self):
+        bump_catalog_version()
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+        self.url = reverse('api:ingredients-list')
+
+    def test_catalog(self):
+        expected = self.client.get(self.url, {'name': ''}).content
+        resp = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(resp['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(resp.content), expected)
+
+        with self.assertNumQueries(0):
+            resp = self.client.get(self.url)
+        self.assertEqual(resp.content, expected)
+        resp = self.client.get(self.url, HTTP_IF_NONE_MATCH=resp['ETag'])
+        self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        Ingredient.objects.create(name='перец', measurement_unit='г')
+        bump_catalog_version()
+        self.assertEqual(len(self.client.get(self.url).json()), 2)
+
+
+class BootstrapTestCase(TestCase):
+    """Тест /api/bootstrap/."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='boot', email='boot@example.com', password='pass',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse('api:bootstrap')
+        Tag.objects.create(name='Обед', color='#49B64E', slug='lunch')
+
+    def test_bootstrap(self):
+        resp = self.client.get(self.url)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = resp.json()
+        self.assertEqual(
+            data['tags'], self.client.get(reverse('api:tags-list')).json()
+        )
+        self.assertEqual(
+            data['user'], self.client.get(reverse('api:users-me')).json()
+        )
+        self.assertEqual(data['favorites_count'], 0)
+        self.assertIn('etag', data['ingredients'])
+
+        with self.assertNumQueries(0):
+            self.client.get(self.url)
+
+        recipe = Recipe.objects.create(
+            author=self.user, name='Суп', text='', cooking_time=5
+        )
+        Favorite.objects.create(user=self.user, recipe=recipe)
+        refresh_ids('favorites', self.user.id)
+        self.assertEqual(self.client.get(self.url).json()['favorites_count'], 1)
+        self.assertIsNone(APIClient().get(self.url).json()['user'])
+
+
+class InvalidationBusTestCase(TestCase):
+    """Тест шины инвалидации между воркерами."""
+
+    def test_file_store(self):
+        path = temp_dir()
+        writer = InvalidationBus(FileStore(path))
+        reader = InvalidationBus(FileStore(path))
+        cleared = []
+        reader.subscribe('tags', lambda: cleared.append('tags'))
+        reader.check()
+
+        writer.bump('tags')
+        self.assertNotEqual(reader.version('tags'), writer.version('tags'))
+        reader.check()
+        self.assertEqual(reader.version('tags'), writer.version('tags'))
+        self.assertEqual(cleared, ['tags'])
+
+        reader.check()
+        self.assertEqual(cleared, ['tags'])
+
+
+class SharedMemoryCacheTestCase(TestCase):
+    """Тест кэша в разделяемой памяти."""
+
+    def make_cache(self, **options):
+        path = os.path.join(temp_dir(), 'cache')
+        return SharedMemoryCache(path, {'OPTIONS': options})
+
+    def test_operations(self):
+        shared = self.make_cache()
+        shared.set('tags', [{'id': 1}])
+        self.assertEqual(shared.get('tags'), [{'id': 1}])
+        self.assertFalse(shared.add('tags', []))
+        self.assertTrue(shared.add('version', 1, None))
+        self.assertEqual(shared.incr('version'), 2)
+        with self.assertRaises(ValueError):
+            shared.incr('missing')
+        shared.set('expired', 1, 0)
+        self.assertIsNone(shared.get('expired'))
+        with self.assertLogs('foodgram.shared_cache', 'WARNING'):
+            self.assertFalse(shared.set('big', b'x' * 5000))
+        self.assertIsNone(shared.get('big'))
+        self.assertEqual(shared.segment.oversize, 1)
+        shared.delete('tags')
+        self.assertFalse(shared.has_key('tags'))
+
+    def test_lru_eviction(self):
+        shared = self.make_cache(MAX_ENTRIES=2, WAYS=2)
+        shared.set('a', 1)
+        shared.set('b', 2)
+        shared.get('a')
+        shared.set('c', 3)
+        self.assertEqual(shared.get_many(['a', 'b', 'c']), {'a': 1, 'c': 3})
+
+    def test_fills_capacity(self):
+        shared = self.make_cache(MAX_ENTRIES=64)
+        keys = [f'key-{number}' for number in range(1000)]
+        for key in keys:
+            shared.set(key, 1)
+        self.assertEqual(sum(shared.has_key(key) for key in keys), 64)
+
+    def test_oversize_viewer_ids(self):
+        """Массив крупнее слота держится в кэше процесса."""
+        user = User.objects.create_user(
+            username='collector', email='collector@example.com',
+            password='pass',
+        )
+        Recipe.objects.bulk_create(
+            Recipe(author=user, name=f'Рецепт {number}', text='',
+                   cooking_time=5)
+            for number in range(300)
+        )
+        Favorite.objects.bulk_create(
+            Favorite(user=user, recipe_id=recipe_id)
+            for recipe_id in Recipe.objects.values_list('id', flat=True)
+        )
+        location = os.path.join(temp_dir(), 'cache')
+        with override_settings(CACHES={'default': {
+            'BACKEND': 'foodgram.shared_cache.SharedMemoryCache',
+            'LOCATION': location,
+            'OPTIONS': {'MAX_ENTRIES': 64, 'SLOT_SIZE': 1024},
+        }}), self.assertLogs('foodgram.shared_cache', 'WARNING'):
+            self.assertEqual(len(load_ids('favorites', user.pk)), 300)
+            with self.assertNumQueries(0):
+                self.assertEqual(len(load_ids('favorites', user.pk)), 300)
+
+    def test_shared_between_processes(self):
+        shared = self.make_cache()
+        shared.add('counter', 0, None)
+        pids = []
+        for _ in range(4):
+            pid = os.fork()
+            if pid == 0:
+                for _ in range(1000):
+                    shared.incr('counter')
+                os._exit(0)
+            pids.append(pid)
+        for pid in pids:
+            os.waitpid(pid, 0)
+        self.assertEqual(shared.get('counter'), 4000)
+
+
+class SimilarRecipesTestCase(TestCase):
+    """Тест похожих рецептов."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='cook', email='cook@example.com', password='pass',
+        )
+        self.ingredients = {
+            name: Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('соль', 'томат', 'базилик', 'сыр', 'сахар')
+        }
+
+    def create_recipe(self, *names):
+        recipe = Recipe.objects.create(
+            author=self.user, name='-'.join(names), text='', cooking_time=5
+        )
+        for name in names:
+            recipe.ingredients.add(
+                self.ingredients[name], through_defaults={'amount': 1}
+            )
+        return recipe
+
+    def similar_ids(self, recipe):
+        resp = APIClient().get(
+            reverse('api:recipes-similar', args=[recipe.id])
+        )
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        return [item['id'] for item in resp.json()]
+
+    def test_similar_recipes(self):
+        pizza = self.create_recipe('соль', 'томат', 'базилик')
+        caprese = self.create_recipe('соль', 'томат', 'базилик', 'сыр')
+        cake = self.create_recipe('соль', 'сахар')
+        call_command('build_similar_recipes', stdout=io.StringIO())
+
+        self.assertEqual(self.similar_ids(pizza), [caprese.id, cake.id])
+        self.assertEqual(self.similar_ids(cake)[-1], caprese.id)
+        with self.assertNumQueries(1):
+            self.similar_ids(pizza)
+
+        salad = self.create_recipe('томат', 'базилик')
+        call_command(
+            'build_similar_recipes', incremental=True, stdout=io.StringIO()
+        )
+        self.assertEqual(self.similar_ids(salad)[0], pizza.id)
+        self.assertIn(salad.id, self.similar_ids(pizza))
+        self.assertFalse(
+            SimilarRecipe.objects.filter(recipe=cake, similar=salad).exists()
+        )
+        self.assertEqual(
+            APIClient().get(
+                reverse('api:recipes-similar', args=[0])
+            ).status_code,
+            status.HTTP_404_NOT_FOUND
+        )
+
+    def test_recipes_without_neighbours(self):
+        pizza = self.create_recipe('соль', 'томат', 'базилик')
+        caprese = self.create_recipe('томат', 'базилик', 'сыр')
+        cake = self.create_recipe('сахар')
+        call_command('build_similar_recipes', stdout=io.StringIO())
+        self.assertEqual(self.similar_ids(caprese), [pizza.id])
+        self.assertEqual(pending_recipe_ids(), [])
+
+        caprese.ingredients.clear()
+        call_command('build_similar_recipes', stdout=io.StringIO())
+        self.assertEqual(self.similar_ids(caprese), [])
+        self.assertEqual(self.similar_ids(pizza), [])
+
+        empty = Recipe.objects.create(
+            author=self.user, name='пусто', text='', cooking_time=5
+        )
+        lonely = self.create_recipe('сахар', 'сыр')
+        call_command(
+            'build_similar_recipes', incremental=True, stdout=io.StringIO()
+        )
+        self.assertEqual(self.similar_ids(lonely), [cake.id])
+        self.assertEqual(pending_recipe_ids(), [])
+        self.assertTrue(
+            Recipe.objects.filter(pk=empty.pk, similar_computed=True).exists()
+        )
+
+    @override_settings(SIMILAR_MAX_SCORES=1)
+    def test_incremental_top_k(self):
+        """Инкрементальный пересчёт хранит не больше top_k соседей."""
+        for names in (('соль', 'томат'), ('соль', 'сыр'), ('соль', 'сахар'),
+                      ('соль', 'базилик'), ('томат', 'сыр')):
+            self.create_recipe(*names)
+        call_command(
+            'build_similar_recipes', top_k=2, stdout=io.StringIO()
+        )
+        new = [
+            self.create_recipe('соль', 'томат', 'сыр'),
+            self.create_recipe('соль', 'базилик', 'сахар'),
+        ]
+        call_command(
+            'build_similar_recipes', incremental=True, top_k=2,
+            stdout=io.StringIO()
+        )
+
+        counts = SimilarRecipe.objects.values('recipe').annotate(
+            count=Count('id')
+        ).order_by()
+        self.assertLessEqual(max(row['count'] for row in counts), 2)
+        matrix = IngredientMatrix()
+        rows = matrix.rows([recipe.id for recipe in new])
+        # Каждая строка считается отдельным произведением.
+        self.assertEqual(len(list(matrix.blocks(rows))), len(rows))
+        expected = matrix.neighbours(rows, 2)
+        for recipe in new:
+            self.assertEqual(
+                self.similar_ids(recipe),
+                [pk for pk, _ in expected[recipe.id]]
+            )
+        # Новый рецепт с томатом и сыром ближе всех к рецепту томат-сыр.
+        self.assertEqual(
+            self.similar_ids(Recipe.objects.get(name='томат-сыр'))[0],
+            new[0].id
+        )
+
+
+class BatchTestCase(TestCase):
+    """Тест /api/batch/."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='batch', email='batch@example.com', password='pass',
+        )
+        token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.recipe = Recipe.objects.create(
+            author=self.user, name='Каша', text='', cooking_time=5
+        )
+        self.url = reverse('api:batch')
+
+    def test_batch(self):
+        favorite = f'/api/recipes/{self.recipe.id}/favorite/'
+        resp = self.client.post(self.url, [
+            {'method': 'POST', 'path': favorite},
+            {'method': 'GET', 'path': f'/api/recipes/{self.recipe.id}/'},
+            {'method': 'GET', 'path': '/api/users/me/'},
+            {'method': 'GET', 'path': '/api/missing/'},
+            {'method': 'POST', 'path': '/api/batch/', 'body': []},
+            {'method': 'GET', 'path': '/api/metrics/'},
+            {'method': 'POST', 'path': '/api/auth/token/login/', 'body': {}},
+        ], format='json')
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        statuses = [item['status'] for item in resp.json()]
+        self.assertEqual(statuses, [201, 200, 200, 404, 400, 400, 400])
+        self.assertTrue(resp.json()[1]['body']['is_favorited'])
+        self.assertEqual(resp.json()[2]['body']['id'], self.user.id)
+
+    def test_limits(self):
+        with self.settings(BATCH_MAX_REQUESTS=2):
+            resp = self.client.post(
+                self.url, [{'method': 'GET', 'path': '/api/tags/'}] * 3,
+                format='json'
+            )
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        resp = self.client.post(
+            self.url, [{'method': 'GET', 'path': '/admin/'}], format='json'
+        )
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(NPLUSONE_THRESHOLD=2)
+class NPlusOneTestCase(TestCase):
+    """
+    Действия RecipeViewSet и UsersViewSet без N+1 запросов.
+
+    Строк больше порога, поэтому запрос на каждую строку сломает
+    ответ через NPlusOneMiddleware.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass',
+        )
+        tag = Tag.objects.create(name='завтрак', color='red', slug='morning')
+        salt = Ingredient.objects.create(name='соль', measurement_unit='г')
+        for number in range(4):
+            author = User.objects.create_user(
+                username=f'writer{number}',
+                email=f'writer{number}@example.com',
+                password='pass',
+            )
+            for _ in range(2):
+                recipe = Recipe.objects.create(
+                    author=author, name=f'Каша {number}', text='',
+                    cooking_time=5,
+                )
+                recipe.tags.add(tag)
+                recipe.ingredients.add(
+                    salt, through_defaults={'amount': number + 1}
+                )
+                refresh_snapshot(recipe)
+                Favorite.objects.create(user=cls.user, recipe=recipe)
+                ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+            Follow.objects.create(user=cls.user, following=author)
+        cls.recipe = recipe
+
+    def setUp(self):
+        cache.clear()
+        refresh_ids('favorites', self.user.id)
+        refresh_ids('shopping_cart', self.user.id)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assert_ok(self, *requests):
+        for url, params in requests:
+            for projection in (True, False):
+                with self.subTest(url=url, projection=projection):
+                    with self.settings(PROJECTION_READS=projection):
+                        response = self.client.get(url, params)
+                    self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_recipe_actions(self):
+        self.assert_ok(
+            (reverse('api:recipes-list'), {}),
+            (reverse('api:recipes-list'), {'is_favorited': 1}),
+            (reverse('api:recipes-list'), {'is_in_shopping_cart': 1}),
+            (reverse('api:recipes-detail', args=(self.recipe.id,)), {}),
+            (reverse('api:recipes-similar', args=(self.recipe.id,)), {}),
+            (reverse('api:recipes-download-shopping-cart'), {}),
+        )
+
+    def test_user_actions(self):
+        self.assert_ok(
+            (reverse('api:users-list'), {}),
+            (reverse('api:users-detail', args=(self.user.id,)), {}),
+            (reverse('api:users-me'), {}),
+            (reverse('api:users-subscriptions'), {'recipes_limit': 1}),
+        )
+
+
+class LoadDataTestCase(TestCase):
+    """Тест загрузки ингредиентов командой load_data."""
+
+    def write(self, name, content):
+        path = os.path.join(temp_dir(), name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def load(self, path, **options):
+        output = io.StringIO()
+        call_command('load_data', path=path, stdout=output, **options)
+        return output.getvalue()
+
+    def test_csv(self):
+        path = self.write(
+            'ingredients.csv',
+            'соль,г\nперец,г\nсоль,г\nсахар,г\nперец,г\nсоль,щепотка\n'
+        )
+        output = self.load(path, batch_size=2)
+        self.assertIn('Прочитано: 6, новых: 4', output)
+        self.assertEqual(Ingredient.objects.count(), 4)
+
+        output = self.load(path, batch_size=2)
+        self.assertIn('новых: 0', output)
+        self.assertEqual(Ingredient.objects.count(), 4)
+
+    def test_json(self):
+        path = self.write('ingredients.json', json.dumps([
+            {'name': 'соль', 'measurement_unit': 'г'},
+            {'name': 'соль', 'measurement_unit': 'г'},
+            {'name': 'мука', 'measurement_unit': 'кг'},
+        ]))
+        self.load(path, batch_size=1)
+        self.load(path)
+        self.assertEqual(
+            sorted(Ingredient.objects.values_list('name', flat=True)),
+            ['мука', 'соль']
+        )
+
+    def test_dry_run(self):
+        path = self.write('ingredients.csv', 'соль,г\nсоль,г\nсоль,г\n')
+        output = self.load(path, batch_size=1, dry_run=True)
+        self.assertEqual(output.count('+ соль, г'), 1)
+        self.assertIn('новых: 1', output)
+        self.assertFalse(Ingredient.objects.exists())
+
+    def test_invalid_json(self):
+        for content in ('[1, 2]', '[{"name": "соль"}]', '[{"name": "соль"'):
+            with self.subTest(content=content):
+                path = self.write('ingredients.json', content)
+                with self.assertRaises(CommandError):
+                    self.load(path)
+        self.assertFalse(Ingredient.objects.exists())
+
+
+@override_settings(MEDIA_ROOT=temp_dir())
+class GenerateDataTestCase(TestCase):
+    """Тест генератора синтетических данных."""
+
+    def setUp(self):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {number}', measurement_unit='г')
+            for number in range(20)
+        )
+
+    def generate(self, **options):
+        output = io.StringIO()
+        call_command('generate_data', stdout=output, **options)
+        return output.getvalue()
+
+    def test_counts(self):
+        self.generate(
+            users=30, recipes=40, follows=200, favorites=300, carts=100
+        )
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(Recipe.objects.count(), 40)
+        self.assertEqual(Follow.objects.count(), 200)
+        self.assertEqual(Favorite.objects.count(), 300)
+        self.assertEqual(ShoppingCart.objects.count(), 100)
+
+        # Степенной закон: самый популярный рецепт заметно популярнее
+        # медианного.
+        counts = sorted(
+            Favorite.objects.order_by().values('recipe')
+            .annotate(count=Count('id'))
+            .values_list('count', flat=True),
+            reverse=True
+        )
+        self.assertGreater(counts[0], 3 * counts[len(counts) // 2])
+
+    def test_shortfall_reported(self):
+        output = self.generate(
+            users=3, recipes=2, follows=50, favorites=1, carts=1
+        )
+        self.assertEqual(Follow.objects.count(), 6)
+        self.assertIn('создано 6 из 50', output)
+
+    def test_power_law_picker(self):
+        picker = PowerLawPicker(range(100), 1.0, random.Random(1))
+        picks = Counter(picker.pick() for _ in range(50000))
+        # Частота обратно пропорциональна рангу: 1-й элемент в 10 раз
+        # чаще 10-го.
+        self.assertAlmostEqual(picks[0] / picks[9], 10, delta=1.5)
+        self.assertEqual(
+            list(iter_batches(range(5), 2)), [[0, 1], [2, 3], [4]]
+        )